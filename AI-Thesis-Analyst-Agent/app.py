@@ -1,9 +1,19 @@
 # app.py (Flask Backend)
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import os
 import uuid
 import time
+import json
+import gzip
+import functools
+import plotly
+from utils.catalog import catalog
+from utils.chart_cache import chart_cache
+from utils.chat_service import chat_respond, chat_respond_stream, chat_respond_batch
+from utils.executor_pool import get_pool
+from utils.ingestion import submit_ingestion, get_job, validate_upload, IngestionError, IngestionQueueFull
+from utils.visualization import chart_template
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'  # Required for session
@@ -15,13 +25,35 @@ MODELS ={
     'technical': 'DeepSeek R1'
 }
 
+# Seconds the canned answers pretend to think for
+FAKE_LATENCY = float(os.environ.get('AI_ANALYST_FAKE_LATENCY', '2'))
+
+# With AI_ANALYST_LIVE_LLM=1, /ask answers through utils.chat_service instead of the canned texts
+LIVE_LLM = os.environ.get('AI_ANALYST_LIVE_LLM') == '1'
+if LIVE_LLM:
+    # Start the code executor workers now rather than on the first question
+    get_pool()
+
+# Largest number of questions accepted by one /ask/batch request
+MAX_BATCH_QUESTIONS = 200
+
+# JSON responses at least this large are gzipped for clients that accept it
+GZIP_MIN_BYTES = 1024
+
+# Provider behind each UI model choice, as configured in utils/chat_service.py
+LLM_BACKENDS = {
+    'basic': 'qwen',
+    'advanced': 'yandexGPT',
+    'technical': 'deepseek'
+}
+
 
 
 def chatbot_response(user_input, model):
     # Add your model-specific logic here
 
     
-    time.sleep(2)  # Pauses program for 2 seconds
+    time.sleep(FAKE_LATENCY)  # Simulated model latency for the canned answers
 
 
     if model == 'basic':
@@ -132,10 +164,39 @@ The new onboarding process is a step in the right direction for getting customer
 
 
 
+@functools.lru_cache(maxsize=None)
+def canned_chart(path):
+    # The canned chart files never change while the app runs
+    with open(path, 'r') as f:
+        return f.read()
+
+
+@app.after_request
+def compress_response(response):
+    # Streamed responses (SSE, NDJSON) are left alone so every event is flushed as it comes
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return response
+    data = response.get_data()
+    if len(data) < GZIP_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Content-Length'] = str(len(response.get_data()))
+    response.vary.add('Accept-Encoding')
+    return response
+
+
 @app.route('/')
 def index():
     session.setdefault('model', 'basic')
-    return render_template('index.html', models=MODELS)
+    # Charts arrive as figure specs; the page loads this plotly.js once and applies the shared template
+    return render_template(
+        'index.html', models=MODELS,
+        plotlyjs_version=plotly.offline.get_plotlyjs_version(), chart_template=chart_template(),
+        live_llm=LIVE_LLM
+    )
 
 @app.route('/set_model', methods=['POST'])
 def set_model():
@@ -149,6 +210,40 @@ def chart():
 
 
 
+def canned_response(user_message, model):
+    """Text and chart HTML that /ask and /ask/stream answer with when LIVE_LLM is off."""
+
+    # Generate text response
+    #text_response = f"{model.capitalize()} response: {user_message}"
+    text_response = chatbot_response(user_message, model)
+
+
+
+    if model in  ('basic', 'Qwen'):
+        chart_html = None
+    # Get Plotly HTML
+    elif model in  ('advanced', 'Advanced AI'):
+
+        #'/Users/artemilin/PycharmProjects/AI-Thesis-Analyst-Agent/templates/loyalty_tier_chart.html'
+        chart_html = canned_chart('/Users/artemilin/PycharmProjects/AI-Thesis-Analyst-Agent/box_plots.html')
+
+    else:
+        chart_html = canned_chart('/Users/artemilin/PycharmProjects/AI-Thesis-Analyst-Agent/templates/NEW_loyalty_tier_chart.html')
+
+    print('chart_html', model)
+
+    # Generate unique ID for each chart
+    #chart_id = f"chart-{uuid.uuid4().hex}"
+    #chart_html = chart_html.replace("%%CHART_CONTAINER%%", chart_id)
+
+    return text_response, chart_html
+
+
+def use_cache(values):
+    # Clients (e.g. tools/load_test.py --no-cache) send no_cache=1 to bypass every cache layer
+    return str(values.get('no_cache', '')).lower() not in ('1', 'true')
+
+
 # app.py - Modify the ask route
 @app.route('/ask', methods=['POST'])
 def ask():
@@ -177,37 +272,98 @@ def ask():
 
     user_message = request.form['user_message']
     model = session.get('model', 'basic')
-    
-    # Generate text response
-    #text_response = f"{model.capitalize()} response: {user_message}"
-    text_response = chatbot_response(user_message, model)
-
 
+    if LIVE_LLM:
+        timings = {}
+        text_response, chart = chat_respond(
+            user_message, app.config['UPLOAD_FOLDER'],
+            model=LLM_BACKENDS.get(model, 'deepseek'), use_cache=use_cache(request.form), timings=timings
+        )
+        response = jsonify({'bot_response': text_response, 'chart': chart})
+        # Per-stage durations for tools/load_test.py and browser dev tools
+        response.headers['Server-Timing'] = ', '.join(
+            f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()
+        )
+        return response
+    
+    text_response, chart_html = canned_response(user_message, model)
+    
+    return jsonify({
+        'bot_response': text_response,
+        'chart_html': chart_html  # Send as separate field
+    })
 
-    if model in  ('basic', 'Qwen'):
-        chart_html = None
-    # Get Plotly HTML
-    elif model in  ('advanced', 'Advanced AI'):
 
-        with open('/Users/artemilin/PycharmProjects/AI-Thesis-Analyst-Agent/box_plots.html', 'r') as f:
-            
-            #'/Users/artemilin/PycharmProjects/AI-Thesis-Analyst-Agent/templates/loyalty_tier_chart.html', 'r') as f:
-            chart_html = f.read()
+@app.route('/charts/<chart_id>')
+def get_chart(chart_id):
+    entry = chart_cache.entry(chart_id)
+    if entry is None:
+        return jsonify(error='Unknown chart'), 404
 
+    # The gzipped copy is a different representation, so it gets its own strong ETag
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+    etag = f"{entry.etag}-gz" if use_gzip else entry.etag
+    # no-cache: browsers and dashboards revalidate every time and mostly get a bodyless 304
+    headers = {'Cache-Control': 'private, no-cache', 'Vary': 'Accept-Encoding'}
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
     else:
-        with open('/Users/artemilin/PycharmProjects/AI-Thesis-Analyst-Agent/templates/NEW_loyalty_tier_chart.html', 'r') as f:
-            chart_html = f.read()
+        response = Response(entry.gzipped if use_gzip else entry.payload, mimetype='application/json', headers=headers)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    return response
 
-    print('chart_html', model)
 
-    # Generate unique ID for each chart
-    #chart_id = f"chart-{uuid.uuid4().hex}"
-    #chart_html = chart_html.replace("%%CHART_CONTAINER%%", chart_id)
-    
-    return jsonify({
-        'bot_response': text_response,
-        'chart_html': chart_html  # Send as separate field
-    })
+@app.route('/ask/stream', methods=['POST'])
+def ask_stream():
+    user_message = request.form['user_message']
+    model = session.get('model', 'basic')
+    backend = LLM_BACKENDS.get(model, 'deepseek')
+    cached = use_cache(request.form)
+    upload_folder = app.config['UPLOAD_FOLDER']
+
+    # Server-sent events: text tokens as they arrive, then the chart as its own event
+    def events():
+        if LIVE_LLM:
+            stream = chat_respond_stream(user_message, upload_folder, model=backend, use_cache=cached)
+        else:
+            # The canned answer is complete already: one token, its chart (HTML) if any, done
+            text_response, chart_html = canned_response(user_message, model)
+            stream = [('token', text_response), ('chart', chart_html), ('done', None)]
+        for event, data in stream:
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/ask/batch', methods=['POST'])
+def ask_batch():
+    payload = request.get_json(silent=True) or {}
+    questions = payload.get('questions')
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) for q in questions):
+        return jsonify(error='Expected a non-empty list of questions'), 400
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        return jsonify(error=f'At most {MAX_BATCH_QUESTIONS} questions per batch'), 400
+
+    backend = LLM_BACKENDS.get(payload.get('model') or session.get('model', 'basic'), 'deepseek')
+    cached = use_cache(payload)
+    upload_folder = app.config['UPLOAD_FOLDER']
+
+    # One JSON object per line, sent as each question finishes; 'index' ties it to the request
+    def results():
+        for result in chat_respond_batch(questions, upload_folder, model=backend, use_cache=cached):
+            yield json.dumps(result) + '\n'
+
+    return Response(
+        stream_with_context(results()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 '''
     user_message = request.form['user_message']
@@ -247,7 +403,7 @@ def ask():
 
 # app.py - Add these new routes
 
-UPLOAD_FOLDER = '/Users/artemilin/PycharmProjects/AI-Thesis-Analyst-Agent/data/uploads'
+UPLOAD_FOLDER = os.environ.get('AI_ANALYST_UPLOAD_FOLDER', '/Users/artemilin/PycharmProjects/AI-Thesis-Analyst-Agent/data/uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -260,6 +416,8 @@ def upload_file():
 
     files = request.files.getlist('files')
     uploaded_files = []
+    jobs = []
+    rejected = []
 
     for file in files:
         if file.filename == '':
@@ -267,13 +425,38 @@ def upload_file():
         if file:
             filename = secure_filename(file.filename)  # Now properly imported
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
+            # Saved under a hidden temp name and only moved into place once valid, so a bad
+            # re-upload never replaces (or deletes) the good file already there
+            tmp_path = os.path.join(app.config['UPLOAD_FOLDER'], f".{filename}.{uuid.uuid4().hex}.upload")
+            file.save(tmp_path)
+            try:
+                validate_upload(tmp_path, filename)
+            except IngestionError as e:
+                os.remove(tmp_path)
+                rejected.append({'file': filename, 'error': str(e)})
+                continue
+            os.replace(tmp_path, file_path)
+            catalog.upsert(file_path)
             uploaded_files.append(filename)
 
+            # Parsing, extraction and indexing happen off the request thread
+            try:
+                jobs.append({'file': filename, 'job_id': submit_ingestion(file_path)})
+            except IngestionQueueFull as e:
+                jobs.append({'file': filename, 'job_id': None, 'error': str(e)})
+
     if not uploaded_files:
-        return jsonify(error='No valid files uploaded'), 400
+        return jsonify(error='No valid files uploaded', rejected=rejected), 400
+
+    return jsonify(success=True, files=uploaded_files, jobs=jobs, rejected=rejected)
+
 
-    return jsonify(success=True, files=uploaded_files)
+@app.route('/upload/<job_id>')
+def upload_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify(error='Unknown job'), 404
+    return jsonify(job)
 
 
 '''
@@ -286,22 +469,19 @@ def list_datasets():
 # app.py - Update the list_datasets route
 @app.route('/datasets')
 def list_datasets():
-    files = []
-    upload_path = app.config['UPLOAD_FOLDER']
-    
-    # Get files with their creation times
-    with os.scandir(upload_path) as entries:
-        for entry in entries:
-            if entry.is_file():
-                files.append({
-                    'name': entry.name,
-                    'upload_time': entry.stat().st_mtime
-                })
-    
-    # Sort files by upload time (newest first)
-    files.sort(key=lambda x: x['upload_time'], reverse=True)
-    
-    return jsonify(files=[f['name'] for f in files])
+    # The catalog is kept newest-first and updated on upload/delete, no directory scan needed
+    records = catalog.list_datasets(app.config['UPLOAD_FOLDER'])
+    return jsonify(files=[r['name'] for r in records])
+
+
+@app.route('/datasets/<name>', methods=['DELETE'])
+def delete_dataset(name):
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(name))
+    if not os.path.isfile(file_path):
+        return jsonify(error='Unknown dataset'), 404
+    os.remove(file_path)
+    catalog.remove(file_path)
+    return jsonify(success=True)
 
 
 
@@ -7,6 +7,17 @@ import statsmodels.discrete.discrete_model as dm
 from scipy.stats import ttest_ind, chi2_contingency, f_oneway, mannwhitneyu, ks_2samp, levene
 from statsmodels.regression.linear_model import OLS
 from statsmodels.tools.tools import add_constant
+from statsmodels.stats.multitest import multipletests
+
+
+# Tests perform_batch_tests can run, by key, with the names the single-pair functions report
+BATCH_TESTS = {
+    't_test': "Independent t-test",
+    'welch': "Welch's t-test",
+    'z_test': "Z-test",
+    'mann_whitney': "Mann-Whitney U test",
+    'ks': "Kolmogorov-Smirnov test",
+}
 
 
 def perform_t_test(group1, group2, equal_var=True):
@@ -467,3 +478,177 @@ def perform_levenes_test(*groups):
         "interpretation": interpretation
     }
 
+
+def _partition(df, group_col, segment_col, metric_col, value_col, groups):
+    """Codes for one pass over the long table: cell (segment x metric), side (0 = first group) and value."""
+    
+    values = pd.to_numeric(df[value_col], errors='coerce').to_numpy(dtype=float)
+    if groups is None:
+        groups = sorted(pd.unique(df[group_col].dropna()))
+    if len(groups) != 2:
+        raise ValueError(f"Expected exactly two groups in '{group_col}', got {list(groups)}")
+    
+    side = np.full(len(df), -1)
+    side[(df[group_col] == groups[0]).to_numpy()] = 0
+    side[(df[group_col] == groups[1]).to_numpy()] = 1
+    
+    segments = df[segment_col] if segment_col is not None else pd.Series('all', index=df.index)
+    cell_codes, cells = pd.MultiIndex.from_arrays([segments, df[metric_col]]).factorize()
+    
+    keep = (side >= 0) & (cell_codes >= 0) & np.isfinite(values)
+    return cell_codes[keep], side[keep], values[keep], cells, groups
+
+
+def _moment_tests(cell, side, values, n_cells):
+    """Counts, means and variances per cell and side, and the t, Welch and z tests built on them."""
+    
+    key = cell * 2 + side
+    n = np.bincount(key, minlength=2 * n_cells).reshape(n_cells, 2).astype(float)
+    sums = np.bincount(key, weights=values, minlength=2 * n_cells).reshape(n_cells, 2)
+    mean = sums / n
+    # Second pass around the means, which is stable where raw sums of squares are not
+    ss = np.bincount(key, weights=(values - mean.ravel()[key]) ** 2, minlength=2 * n_cells).reshape(n_cells, 2)
+    var = ss / (n - 1)
+    
+    n1, n2 = n[:, 0], n[:, 1]
+    diff = mean[:, 0] - mean[:, 1]
+    
+    pooled_df = n1 + n2 - 2
+    pooled_se = np.sqrt((ss[:, 0] + ss[:, 1]) / pooled_df * (1 / n1 + 1 / n2))
+    t_stat = diff / pooled_se
+    
+    se1, se2 = var[:, 0] / n1, var[:, 1] / n2
+    welch_se = np.sqrt(se1 + se2)
+    welch_df = (se1 + se2) ** 2 / (se1 ** 2 / (n1 - 1) + se2 ** 2 / (n2 - 1))
+    welch_stat = diff / welch_se
+    
+    results = {
+        't_test': (t_stat, 2 * stats.t.sf(np.abs(t_stat), pooled_df)),
+        'welch': (welch_stat, 2 * stats.t.sf(np.abs(welch_stat), welch_df)),
+        # Sample variances stand in for the population ones, as in perform_z_test
+        'z_test': (welch_stat, 2 * stats.norm.sf(np.abs(welch_stat))),
+    }
+    return n, mean, results
+
+
+def _rank_tests(cell, side, values, n, n_cells):
+    """Mann-Whitney U and two-sample KS for every cell from one sort of the whole table."""
+    
+    order = np.lexsort((values, cell))
+    cell, side, values = cell[order], side[order], values[order]
+    size = len(values)
+    n1, n2 = n[:, 0], n[:, 1]
+    
+    # Runs of equal values within a cell share their average rank
+    new_block = np.ones(size, dtype=bool)
+    new_block[1:] = (cell[1:] != cell[:-1]) | (values[1:] != values[:-1])
+    block_start = np.flatnonzero(new_block)
+    block_end = np.append(block_start[1:], size)
+    block_cell = cell[block_start]
+    cell_start = np.searchsorted(cell, np.arange(n_cells))
+    
+    block_rank = (block_start + block_end + 1) / 2 - cell_start[block_cell]
+    ranks = np.repeat(block_rank, block_end - block_start)
+    ties = (block_end - block_start).astype(float)
+    tie_term = np.bincount(block_cell, weights=ties ** 3 - ties, minlength=n_cells)
+    
+    # Normal approximation with tie and continuity correction (scipy's method='asymptotic')
+    total = n1 + n2
+    u1 = np.bincount(cell[side == 0], weights=ranks[side == 0], minlength=n_cells) - n1 * (n1 + 1) / 2
+    mu = n1 * n2 / 2
+    sigma = np.sqrt(n1 * n2 / 12 * ((total + 1) - tie_term / (total * (total - 1))))
+    u_z = (np.maximum(u1, n1 * n2 - u1) - mu - 0.5) / sigma
+    u_p = np.clip(2 * stats.norm.sf(u_z), 0, 1)
+    empty = (n1 == 0) | (n2 == 0)
+    u1[empty] = u_p[empty] = np.nan
+    
+    # KS: largest gap between the two empirical CDFs, checked at the end of every run of ties
+    first = np.cumsum(side == 0)
+    second = np.cumsum(side == 1)
+    before = np.concatenate([[0], first])[cell_start], np.concatenate([[0], second])[cell_start]
+    last = block_end - 1
+    gaps = np.abs(
+        (first[last] - before[0][block_cell]) / n1[block_cell]
+        - (second[last] - before[1][block_cell]) / n2[block_cell]
+    )
+    ks_stat = np.zeros(n_cells)
+    np.maximum.at(ks_stat, block_cell, np.nan_to_num(gaps))
+    ks_stat[empty] = np.nan
+    # Asymptotic distribution of the statistic (scipy's method='asymp')
+    ks_p = np.clip(stats.kstwo.sf(ks_stat, np.round(n1 * n2 / total)), 0, 1)
+    
+    return {'mann_whitney': (u1, u_p), 'ks': (ks_stat, ks_p)}
+
+
+def perform_batch_tests(df, group_col='group', segment_col='segment', metric_col='metric', value_col='value',
+                        groups=None, tests=tuple(BATCH_TESTS), correction='fdr_bh', alpha=0.05):
+    """
+    Run two-group tests for every segment x metric combination of a long-format table at once.
+    
+    The table is partitioned once and every statistic is computed for all combinations
+    together with NumPy/SciPy array operations, so hundreds of combinations cost about as
+    much as one pass over the data. Mann-Whitney U and KS use their asymptotic p-values.
+    
+    Parameters:
+    -----------
+    df : DataFrame
+        Long-format data with one observation per row
+    group_col, segment_col, metric_col, value_col : str
+        Columns holding the group label, segment, metric name and observed value.
+        segment_col may be None to test each metric over the whole table.
+    groups : tuple, optional
+        The two groups to compare, e.g. ('control', 'treatment'). Differences are
+        groups[0] minus groups[1]. If None, the two labels in sorted order.
+    tests : iterable of str, default=all of BATCH_TESTS
+        Keys of BATCH_TESTS to run
+    correction : str, default='fdr_bh'
+        Multiple-testing correction applied across all combinations of each test:
+        'fdr_bh' (Benjamini-Hochberg), 'holm', or any other statsmodels multipletests method
+    alpha : float, default=0.05
+        Significance level for the corrected p-values
+    
+    Returns:
+    --------
+    DataFrame: One row per segment, metric and test, with group sizes and means, the
+    difference in means, test statistic, raw and adjusted p-values and significance
+    """
+    unknown = set(tests) - set(BATCH_TESTS)
+    if unknown:
+        raise ValueError(f"Unknown tests: {sorted(unknown)}")
+    
+    cell, side, values, cells, groups = _partition(df, group_col, segment_col, metric_col, value_col, groups)
+    n_cells = len(cells)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n, mean, results = _moment_tests(cell, side, values, n_cells)
+        if {'mann_whitney', 'ks'} & set(tests):
+            results.update(_rank_tests(cell, side, values, n, n_cells))
+    
+    frames = []
+    for test in tests:
+        statistic, p_value = results[test]
+        # Combinations with too few observations have no p-value and are left out of the correction
+        p_adjusted = np.full(n_cells, np.nan)
+        valid = np.isfinite(p_value)
+        if valid.any():
+            p_adjusted[valid] = multipletests(p_value[valid], alpha=alpha, method=correction)[1]
+        frames.append(pd.DataFrame({
+            'segment': cells.get_level_values(0),
+            'metric': cells.get_level_values(1),
+            'test': BATCH_TESTS[test],
+            f'n_{groups[0]}': n[:, 0].astype(int),
+            f'n_{groups[1]}': n[:, 1].astype(int),
+            f'mean_{groups[0]}': mean[:, 0],
+            f'mean_{groups[1]}': mean[:, 1],
+            'difference': mean[:, 0] - mean[:, 1],
+            'statistic': statistic,
+            'p_value': p_value,
+            'p_adjusted': p_adjusted,
+            'significant': p_adjusted < alpha,
+        }))
+    
+    result = pd.concat(frames, ignore_index=True)
+    if segment_col is None:
+        result = result.drop(columns='segment')
+    return result
+
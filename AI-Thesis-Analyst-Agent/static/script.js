@@ -16,6 +16,12 @@ document.getElementById('model-select').addEventListener('change', function() {
 
 
 
+// Stream answers token by token from /ask/stream instead of waiting for /ask; only worth it
+// when the server answers through a live LLM (the canned answers arrive whole either way)
+const USE_STREAMING = window.LIVE_LLM === true;
+
+
+
 document.getElementById('user-form').addEventListener('submit', function(e) {
     e.preventDefault();
     const userInput = document.getElementById('user-input');
@@ -27,17 +33,21 @@ document.getElementById('user-form').addEventListener('submit', function(e) {
         
         //
         // Send to backend
-        fetch('/ask', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/x-www-form-urlencoded',
-            },
-            body: `user_message=${encodeURIComponent(message)}`
-        })
-        .then(response => response.json())
-        .then(data => {
-            addBotMessage(data.bot_response, data.chart_html);
-        });
+        if (USE_STREAMING) {
+            streamBotResponse(message);
+        } else {
+            fetch('/ask', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/x-www-form-urlencoded',
+                },
+                body: `user_message=${encodeURIComponent(message)}`
+            })
+            .then(response => response.json())
+            .then(data => {
+                addBotMessage(data.bot_response, data.chart || data.chart_html);
+            });
+        }
         
         userInput.value = '';
     }
@@ -91,6 +101,11 @@ document.getElementById('file-input').addEventListener('change', function(e) {
                 const div = document.createElement('div');
                 div.textContent = file;
                 list.prepend(div);  // Add new files to top
+
+                const job = (data.jobs || []).find(j => j.file === file);
+                if (job && job.job_id) {
+                    pollIngestion(job.job_id, div, file);
+                }
             });
         }
     })
@@ -102,6 +117,25 @@ document.getElementById('file-input').addEventListener('change', function(e) {
 
 
 
+// Poll the background ingestion job until the dataset is ready to query
+function pollIngestion(jobId, div, file) {
+    fetch(`/upload/${jobId}`)
+        .then(response => response.json())
+        .then(job => {
+            if (job.status === 'done') {
+                div.textContent = file;
+            } else if (job.status === 'failed') {
+                div.textContent = `${file} (failed: ${job.error})`;
+            } else {
+                div.textContent = `${file} (${job.stage || job.status} ${Math.round(job.progress * 100)}%)`;
+                setTimeout(() => pollIngestion(jobId, div, file), 1000);
+            }
+        })
+        .catch(error => console.error('Error polling upload:', error));
+}
+
+
+
 // static/script.js - Update loadDatasets and initialization
 // Load datasets when page loads
 document.addEventListener('DOMContentLoaded', function() {
@@ -126,7 +160,7 @@ function loadDatasets() {
 
 
 // static/script.js - Update message handling
-function addBotMessage(text, chartHtml) {
+function addBotMessage(text, chart) {
     const botMessages = document.getElementById('bot-messages');
     
     // Create message container
@@ -140,28 +174,8 @@ function addBotMessage(text, chartHtml) {
     messageDiv.appendChild(textDiv);
     
     // Add chart content
-    if (chartHtml) {
-        const chartContainer = document.createElement('div');
-        chartContainer.className = 'plotly-chart-container '//'chart-container';
-        
-        // Parse and inject chart HTML
-        const parser = new DOMParser();
-        const doc = parser.parseFromString(chartHtml, 'text/html');
-        const chartContent = doc.body.firstChild;
-        
-        // Clone and append chart nodes
-        const importedNode = document.importNode(chartContent, true);
-        chartContainer.appendChild(importedNode);
-        
-        // Re-execute scripts
-        const scripts = chartContainer.querySelectorAll('script');
-        scripts.forEach(script => {
-            const newScript = document.createElement('script');
-            newScript.text = script.text;
-            chartContainer.appendChild(newScript);
-        });
-        
-        messageDiv.appendChild(chartContainer);
+    if (chart) {
+        appendChart(messageDiv, chart);
     }
     
     botMessages.appendChild(messageDiv);
@@ -169,6 +183,110 @@ function addBotMessage(text, chartHtml) {
 }
 
 
+// Charts come as Plotly figure specs ({data, layout}) drawn with the page's plotly.js;
+// the canned answers still send chart HTML
+function appendChart(messageDiv, chart) {
+    if (typeof chart === 'string') {
+        appendChartHtml(messageDiv, chart);
+        return;
+    }
+    
+    const chartContainer = document.createElement('div');
+    chartContainer.className = 'plotly-chart-container';
+    messageDiv.appendChild(chartContainer);
+    
+    // Specs leave out the layout template, which is the same for every chart
+    const layout = Object.assign({ template: window.CHART_TEMPLATE }, chart.layout);
+    Plotly.newPlot(chartContainer, chart.data, layout, { responsive: true });
+}
+
+
+function appendChartHtml(messageDiv, chartHtml) {
+    const chartContainer = document.createElement('div');
+    chartContainer.className = 'plotly-chart-container '//'chart-container';
+    
+    // Parse and inject chart HTML
+    const parser = new DOMParser();
+    const doc = parser.parseFromString(chartHtml, 'text/html');
+    const chartContent = doc.body.firstChild;
+    
+    // Clone and append chart nodes
+    const importedNode = document.importNode(chartContent, true);
+    chartContainer.appendChild(importedNode);
+    
+    // Re-execute scripts
+    const scripts = chartContainer.querySelectorAll('script');
+    scripts.forEach(script => {
+        const newScript = document.createElement('script');
+        newScript.text = script.text;
+        chartContainer.appendChild(newScript);
+    });
+    
+    messageDiv.appendChild(chartContainer);
+}
+
+
+// Read server-sent events from /ask/stream: text tokens are appended as they
+// arrive and the chart is added when its event comes in
+function streamBotResponse(message) {
+    const botMessages = document.getElementById('bot-messages');
+    
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message bot-message';
+    const textDiv = document.createElement('div');
+    textDiv.className = 'bot-text';
+    messageDiv.appendChild(textDiv);
+    botMessages.appendChild(messageDiv);
+    
+    const handleEvent = (event, data) => {
+        if (event === 'token') {
+            textDiv.textContent += data;
+        } else if (event === 'chart' && data) {
+            appendChart(messageDiv, data);
+        }
+        botMessages.scrollTop = botMessages.scrollHeight;
+    };
+    
+    fetch('/ask/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/x-www-form-urlencoded',
+        },
+        body: `user_message=${encodeURIComponent(message)}`
+    })
+    .then(async response => {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const raw = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let event = 'message';
+                let data = '';
+                raw.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                handleEvent(event, data ? JSON.parse(data) : null);
+            }
+        }
+    })
+    .catch(error => {
+        console.error('Error streaming response:', error);
+        textDiv.textContent += ' [connection lost]';
+    });
+}
+
+
 
 
 function appendBotMessage(text, chartHtml = '') {
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the app's modules the same way app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """Point the dataset cache at a fresh directory so tests never see each other's files."""
+
+    from utils import data_processor
+
+    directory = tmp_path / 'cache'
+    monkeypatch.setattr(data_processor, 'CACHE_DIR', str(directory))
+    return directory
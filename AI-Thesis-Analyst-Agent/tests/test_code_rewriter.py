@@ -0,0 +1,35 @@
+import ast
+
+import pytest
+
+from utils.code_rewriter import UnsafeCodeError, validate
+
+
+@pytest.mark.parametrize('code', [
+    "df.to_csv('/tmp/out.csv')",
+    "df.to_json('/tmp/out.json')",
+    "df.to_html('/tmp/out.html')",
+    "df.to_latex('/tmp/out.tex')",
+    "df.to_markdown('/tmp/out.md')",
+    "df.to_excel('/tmp/out.xlsx')",
+    "df.to_string('/tmp/out.txt')",
+    "df.to_pickle('/tmp/out.pkl')",
+    "np.save('/tmp/out.npy', df.values)",
+    "np.savetxt('/tmp/out.txt', df.values)",
+    "df.values.tofile('/tmp/out.bin')",
+])
+def test_writers_are_refused(code):
+
+    with pytest.raises(UnsafeCodeError):
+        validate(ast.parse(code))
+
+
+@pytest.mark.parametrize('code', [
+    "result_df = df.groupby('a')['b'].sum().to_frame()",
+    "values = df['a'].to_numpy()",
+    "records = df.to_dict('records')",
+    "df['d'] = pd.to_datetime(df['d'])",
+])
+def test_in_memory_conversions_are_allowed(code):
+
+    validate(ast.parse(code))
@@ -0,0 +1,31 @@
+import numpy as np
+
+from utils.data_processor import load_dataset
+
+
+def _roundtrip(tmp_path, text):
+
+    path = tmp_path / 'data.csv'
+    path.write_text(text)
+    return load_dataset(str(path))
+
+
+def test_integral_floats_beyond_int64_stay_float(tmp_path, cache_dir):
+
+    df = _roundtrip(tmp_path, "value\n1e20\n2\n")
+    assert df['value'].dtype == np.float64
+    assert df['value'].tolist() == [1e20, 2.0]
+
+
+def test_uint64_max_keeps_its_value(tmp_path, cache_dir):
+
+    df = _roundtrip(tmp_path, "value\n18446744073709551615\n0\n")
+    assert df['value'].dtype == np.uint64
+    assert df['value'].tolist() == [18446744073709551615, 0]
+
+
+def test_small_integers_are_downcast(tmp_path, cache_dir):
+
+    df = _roundtrip(tmp_path, "value\n1\n-2\n")
+    assert df['value'].dtype == np.int8
+    assert df['value'].tolist() == [1, -2]
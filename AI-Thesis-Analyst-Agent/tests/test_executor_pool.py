@@ -0,0 +1,26 @@
+import pandas as pd
+
+from utils.executor_pool import decode_result, encode_result
+
+
+def _roundtrip(df, compression=None):
+
+    return decode_result(*encode_result(df, compression=compression))
+
+
+def test_string_labelled_frames_use_arrow():
+
+    df = pd.DataFrame({'tier': ['a', 'b'], 'n': [1, 2]})
+    kind, _ = encode_result(df)
+    assert kind == 'arrow'
+    pd.testing.assert_frame_equal(_roundtrip(df), df)
+
+
+def test_integer_column_labels_survive():
+
+    counts = pd.DataFrame({'tier': ['a', 'a', 'b'], 'rating': [1, 2, 1]}).value_counts().unstack(fill_value=0)
+    # Integer labels alone, and mixed with the string label reset_index() brings back
+    for df in (counts, counts.reset_index()):
+        result = _roundtrip(df, compression='lz4')
+        assert list(result.columns) == list(df.columns)
+        pd.testing.assert_frame_equal(result, df)
@@ -0,0 +1,238 @@
+"""Replay a question mix against /ask and report latency percentiles per stage.
+
+Against a running app (started with AI_ANALYST_LIVE_LLM=1 and the provider URLs
+pointing at tools/mock_llm_server.py):
+
+    python tools/load_test.py --url http://127.0.0.1:5000 --concurrency 8 --requests 200
+
+Or fully self-contained, with the mock server and the app started in-process:
+
+    python tools/load_test.py --self-host --uploads data/uploads --profile deepseek=realistic
+
+Stage timings come from the ``Server-Timing`` header of /ask; with ``--stream``
+requests go to /ask/stream and time-to-first-token is reported as well. With
+``--batch N`` questions go to /ask/batch N at a time, and ``client`` is the time
+until each question's result line arrived. ``--no-cache`` sends ``no_cache=1`` with every
+request, so the app skips all its cache layers and the cold path is measured.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_QUESTIONS = [
+    "Compare total visits between the A/B groups",
+    "What is the average number of visits per loyalty tier?",
+    "Show the trend of registrations over time",
+    "Show the distribution of total visits",
+    "How many clients are in each loyalty tier?",
+    "Summarise the experiment results and recommend next steps",
+]
+
+UI_MODELS = ['basic', 'advanced', 'technical']
+
+
+def parse_server_timing(header):
+    """``'files;dur=1.2, total;dur=30.5'`` -> ``{'files': 0.0012, 'total': 0.0305}`` (seconds)."""
+
+    timings = {}
+    for entry in filter(None, (part.strip() for part in (header or '').split(','))):
+        name, _, params = entry.partition(';')
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'dur':
+                timings[name.strip()] = float(value) / 1000
+    return timings
+
+
+class Recorder:
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def error(self, kind):
+        with self._lock:
+            self.errors[kind] += 1
+
+    def report(self, wall_seconds):
+
+        completed = len(self.samples.get('client', []))
+        lines = [
+            f"{'stage':<14}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+        ]
+        for stage in sorted(self.samples, key=lambda s: (s in ('total', 'client'), s)):
+            values = np.array(self.samples[stage]) * 1000
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            lines.append(f"{stage:<14}{len(values):>6}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{values.max():>10.1f}")
+        lines.append('')
+        lines.append(f"completed {completed} in {wall_seconds:.1f}s -> {completed / wall_seconds:.2f} req/s")
+        if self.errors:
+            lines.append('errors: ' + ', '.join(f"{kind}={n}" for kind, n in sorted(self.errors.items())))
+        return '\n'.join(lines)
+
+
+def make_session(base_url, model):
+
+    session = requests.Session()
+    session.post(f"{base_url}/set_model", data={'model': model}, timeout=10).raise_for_status()
+    return session
+
+
+def ask_once(session, base_url, question, recorder, stream=False, cache=True, timeout=120):
+
+    start = time.perf_counter()
+    form = {'user_message': question} if cache else {'user_message': question, 'no_cache': '1'}
+    try:
+        if stream:
+            response = session.post(f"{base_url}/ask/stream", data=form,
+                                    stream=True, timeout=timeout)
+            response.raise_for_status()
+            first_token = None
+            event = None
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if line.startswith('event:'):
+                    event = line[len('event:'):].strip()
+                elif line.startswith('data:') and event == 'token' and first_token is None:
+                    first_token = time.perf_counter() - start
+                    recorder.add('ttft', first_token)
+                elif line.startswith('data:') and event == 'done':
+                    break
+        else:
+            response = session.post(f"{base_url}/ask", data=form, timeout=timeout)
+            response.raise_for_status()
+            for stage, seconds in parse_server_timing(response.headers.get('Server-Timing')).items():
+                recorder.add(stage, seconds)
+    except requests.exceptions.HTTPError as e:
+        recorder.error(f"http_{e.response.status_code}")
+        return
+    except requests.exceptions.RequestException as e:
+        recorder.error(type(e).__name__)
+        return
+    recorder.add('client', time.perf_counter() - start)
+
+
+def ask_batch(session, base_url, questions, recorder, cache=True, timeout=600):
+
+    start = time.perf_counter()
+    try:
+        response = session.post(f"{base_url}/ask/batch", json={'questions': questions, 'no_cache': not cache},
+                                stream=True, timeout=timeout)
+        response.raise_for_status()
+        for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+            if not line:
+                continue
+            result = json.loads(line)
+            recorder.add('client', time.perf_counter() - start)
+            for stage, seconds in result['timings'].items():
+                recorder.add(stage, seconds)
+    except requests.exceptions.HTTPError as e:
+        recorder.error(f"http_{e.response.status_code}")
+    except requests.exceptions.RequestException as e:
+        recorder.error(type(e).__name__)
+
+
+def run(base_url, questions, concurrency, total, stream=False, warmup=0, seed=0, batch=0, cache=True):
+
+    rng = random.Random(seed)
+    # One session per worker slot, each pinned to a UI model like a real browser tab
+    sessions = [make_session(base_url, UI_MODELS[i % len(UI_MODELS)]) for i in range(concurrency)]
+    plan = [rng.choice(questions) for _ in range(warmup + total)]
+
+    for i, question in enumerate(plan[:warmup]):
+        ask_once(sessions[i % concurrency], base_url, question, Recorder(), stream, cache)
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if batch:
+            for i in range(0, total, batch):
+                chunk = plan[warmup + i:warmup + i + batch]
+                pool.submit(ask_batch, sessions[(i // batch) % concurrency], base_url, chunk, recorder, cache)
+        else:
+            for i, question in enumerate(plan[warmup:]):
+                pool.submit(ask_once, sessions[i % concurrency], base_url, question, recorder, stream, cache)
+    return recorder, time.perf_counter() - start
+
+
+def self_host(uploads, profiles, default_profile):
+    """Start the mock provider and the Flask app in this process; returns the app URL."""
+
+    import logging
+    from werkzeug.serving import make_server
+    sys.path.insert(0, APP_DIR)
+    from tools.mock_llm_server import start_in_thread
+
+    mock = start_in_thread(profiles=profiles, default_profile=default_profile)
+    mock_url = f"http://127.0.0.1:{mock.server_address[1]}"
+    # Must be set before app (and with it utils.chat_service) is imported
+    os.environ.update({
+        'AI_ANALYST_LIVE_LLM': '1',
+        'AI_ANALYST_UPLOAD_FOLDER': os.path.abspath(uploads),
+        'DEEPSEEK_API_URL': f"{mock_url}/deepseek",
+        'QWEN_API_URL': f"{mock_url}/qwen",
+        'YANDEX_API_URL': f"{mock_url}/yandex",
+    })
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=0, help='requests sent (and ignored) before measuring')
+    parser.add_argument('--questions', help='file with one question per line')
+    parser.add_argument('--stream', action='store_true', help='hit /ask/stream and report time to first token')
+    parser.add_argument('--batch', type=int, default=0, metavar='N', help='send questions to /ask/batch, N per request')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print raw samples as JSON instead of a table')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='ask the app to skip every cache layer: LLM responses, compiled code, code results and charts')
+
+    group = parser.add_argument_group('self-hosted mode')
+    group.add_argument('--self-host', action='store_true')
+    group.add_argument('--uploads', default=os.path.join(APP_DIR, 'data', 'uploads'))
+    group.add_argument('--profile', action='append', default=[], metavar='PROVIDER=PROFILE')
+    group.add_argument('--default-profile', default='fast')
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, 'r', encoding='utf-8') as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    base_url = args.url
+    if args.self_host:
+        profiles = dict(item.split('=', 1) for item in args.profile)
+        base_url = self_host(args.uploads, profiles, args.default_profile)
+
+    recorder, wall = run(base_url, questions, args.concurrency, args.requests, args.stream, args.warmup, args.seed,
+                         args.batch, not args.no_cache)
+    if args.json:
+        print(json.dumps({'wall_seconds': wall, 'samples': recorder.samples, 'errors': recorder.errors}))
+    else:
+        print(recorder.report(wall))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Stand-in LLM provider for exercising the app without API keys or network.
+
+Speaks the same completion protocol as ``utils.llm_client`` (``prompt`` in,
+``choices[0].text`` out, ``data:`` lines when ``stream`` is set). Each provider is
+a URL path, and each path follows a scriptable profile:
+
+    python tools/mock_llm_server.py --port 8900 --profile deepseek=realistic --profile qwen=flaky
+
+    export DEEPSEEK_API_URL=http://127.0.0.1:8900/deepseek
+    export QWEN_API_URL=http://127.0.0.1:8900/qwen
+    export YANDEX_API_URL=http://127.0.0.1:8900/yandex
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# latency/jitter in seconds before the first byte, tokens_per_second paces streams,
+# error_rate is the share of requests answered with error_status
+PROFILES = {
+    'instant': {'latency': 0.0, 'jitter': 0.0, 'tokens_per_second': 0, 'error_rate': 0.0, 'error_status': 503},
+    'fast': {'latency': 0.05, 'jitter': 0.02, 'tokens_per_second': 400, 'error_rate': 0.0, 'error_status': 503},
+    'realistic': {'latency': 0.8, 'jitter': 0.4, 'tokens_per_second': 40, 'error_rate': 0.01, 'error_status': 503},
+    'slow': {'latency': 4.0, 'jitter': 2.0, 'tokens_per_second': 15, 'error_rate': 0.0, 'error_status': 503},
+    'flaky': {'latency': 0.5, 'jitter': 0.3, 'tokens_per_second': 40, 'error_rate': 0.25, 'error_status': 503},
+    'down': {'latency': 0.0, 'jitter': 0.0, 'tokens_per_second': 0, 'error_rate': 1.0, 'error_status': 500},
+}
+
+# Code and SQL answers keyed by a word in the question; all run against customer_base_dataset.csv
+CANNED_CODE = {
+    'tier': (
+        "df = pd.read_csv('customer_base_dataset.csv')\n"
+        "result_df = df.groupby('loyalty_tier', observed=True)['total_visits'].mean().reset_index()"
+    ),
+    'group': (
+        "df = pd.read_csv('customer_base_dataset.csv')\n"
+        "result_df = df.groupby('a_b_group', observed=True)['total_visits'].describe().reset_index()"
+    ),
+    'trend': (
+        "df = pd.read_csv('customer_base_dataset.csv')\n"
+        "df['month'] = df['registration_date'].dt.to_period('M').dt.to_timestamp()\n"
+        "result_df = df.groupby('month')['client_id'].count().reset_index(name='registrations')"
+    ),
+    'distribution': (
+        "df = pd.read_csv('customer_base_dataset.csv')\n"
+        "result_df = df[['total_visits']]"
+    ),
+}
+DEFAULT_CODE = CANNED_CODE['group']
+
+CANNED_SQL = {
+    'tier': "SELECT loyalty_tier, AVG(total_visits) AS total_visits FROM customer_base_dataset GROUP BY 1 ORDER BY 1",
+    'group': (
+        "SELECT a_b_group, COUNT(*) AS clients, AVG(total_visits) AS mean_visits, "
+        "MEDIAN(total_visits) AS median_visits FROM customer_base_dataset GROUP BY 1 ORDER BY 1"
+    ),
+    'trend': (
+        "SELECT date_trunc('month', registration_date) AS month, COUNT(*) AS registrations "
+        "FROM customer_base_dataset GROUP BY 1 ORDER BY 1"
+    ),
+    'distribution': "SELECT total_visits FROM customer_base_dataset",
+}
+DEFAULT_SQL = CANNED_SQL['group']
+
+CANNED_TEXT = (
+    "The treatment group shows a slightly lower median visit count than control, while the "
+    "average stays close. Loyalty tier enrollment is higher in treatment, driven by Bronze "
+    "and Silver. Recommendation: keep the new onboarding and test stronger Gold-tier perks."
+)
+
+
+def pick_code(prompt):
+
+    # Only look at the question section; the schema mentions every column name
+    question = prompt.split('User question:', 1)[-1].split('\n\n', 1)[0].lower()
+    canned, default = (CANNED_SQL, DEFAULT_SQL) if 'SQL' in prompt else (CANNED_CODE, DEFAULT_CODE)
+    for word, code in canned.items():
+        if word in question:
+            return code
+    return default
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _profile(self):
+        provider = self.path.strip('/').split('/')[0]
+        return self.server.profiles.get(provider, self.server.default_profile)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': 'invalid JSON'})
+            return
+
+        profile = self._profile()
+        with self.server.stats_lock:
+            self.server.stats['requests'] += 1
+
+        time.sleep(max(0.0, random.gauss(profile['latency'], profile['jitter'])))
+        if random.random() < profile['error_rate']:
+            with self.server.stats_lock:
+                self.server.stats['errors'] += 1
+            self._send_json(profile['error_status'], {'error': 'scripted failure'})
+            return
+
+        # Low temperature is what query_llm uses for code requests
+        is_code = body.get('temperature', 1.0) < 0.5
+        text = pick_code(body.get('prompt', '')) if is_code else CANNED_TEXT
+
+        if not body.get('stream'):
+            self._send_json(200, {'choices': [{'text': text}]})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        delay = 1.0 / profile['tokens_per_second'] if profile['tokens_per_second'] else 0.0
+        for i, word in enumerate(text.split(' ')):
+            token = word if i == 0 else ' ' + word
+            self._write_chunk(f"data: {json.dumps({'choices': [{'text': token}]})}\n\n".encode('utf-8'))
+            if delay:
+                time.sleep(delay)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def make_server(host='127.0.0.1', port=0, profiles=None, default_profile='fast'):
+    """Build (but don't start) a mock server; ``port=0`` picks a free port."""
+
+    server = ThreadingHTTPServer((host, port), MockLLMHandler)
+    server.daemon_threads = True
+    server.profiles = {name: PROFILES[p] if isinstance(p, str) else p for name, p in (profiles or {}).items()}
+    server.default_profile = PROFILES[default_profile]
+    server.stats = {'requests': 0, 'errors': 0}
+    server.stats_lock = threading.Lock()
+    return server
+
+
+def start_in_thread(**kwargs):
+
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--default-profile', default='fast', choices=sorted(PROFILES))
+    parser.add_argument('--profile', action='append', default=[], metavar='PROVIDER=PROFILE',
+                        help='profile for one provider path, e.g. qwen=flaky')
+    parser.add_argument('--profiles-file', help='JSON file of extra named profiles')
+    args = parser.parse_args()
+
+    if args.profiles_file:
+        with open(args.profiles_file, 'r', encoding='utf-8') as f:
+            PROFILES.update(json.load(f))
+
+    profiles = dict(item.split('=', 1) for item in args.profile)
+    server = make_server(args.host, args.port, profiles, args.default_profile)
+    print(f"Mock LLM server on http://{args.host}:{server.server_address[1]}/<provider>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
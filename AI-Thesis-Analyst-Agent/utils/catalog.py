@@ -0,0 +1,171 @@
+import json
+import os
+import sqlite3
+import threading
+from utils.data_processor import CACHE_DIR, dataset_fingerprint
+
+CATALOG_PATH = os.path.join(CACHE_DIR, 'catalog.sqlite')
+
+DATASET_TYPES = {'.csv': 'csv', '.pdf': 'pdf', '.txt': 'txt', '.json': 'json'}
+
+COLUMNS = ('path', 'folder', 'name', 'type', 'size', 'rows', 'schema', 'fingerprint', 'uploaded_at')
+
+
+class DatasetCatalog:
+    """SQLite-backed list of uploaded datasets with an in-memory mirror per folder.
+
+    Every write bumps a version counter in the database. Reads check that one-row
+    counter and drop the mirror when another process (e.g. another web worker) has
+    written since, so uploads and deletes are seen everywhere.
+    """
+
+    def __init__(self, db_path=CATALOG_PATH):
+        self.db_path = db_path
+        self._folders = {}
+        self._version = None
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS datasets (
+                    path TEXT PRIMARY KEY,
+                    folder TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    type TEXT,
+                    size INTEGER,
+                    rows INTEGER,
+                    schema TEXT,
+                    fingerprint TEXT,
+                    uploaded_at REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS datasets_folder ON datasets (folder)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS catalog_version (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO catalog_version VALUES (0, 0)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _check_version(self):
+        # Caller holds the lock
+        with self._connect() as conn:
+            version = conn.execute("SELECT version FROM catalog_version").fetchone()[0]
+        if version != self._version:
+            self._folders.clear()
+            self._version = version
+
+    def _bump_version(self, conn):
+        # Caller holds the lock, inside the write's transaction
+        conn.execute("UPDATE catalog_version SET version = version + 1")
+        version = conn.execute("SELECT version FROM catalog_version").fetchone()[0]
+        if self._version is not None and version == self._version + 1:
+            # Only this write happened since the mirror was loaded; it stays valid
+            self._version = version
+        else:
+            self._folders.clear()
+            self._version = None
+
+    def _load_folder(self, folder):
+        # Caller holds the lock
+        entries = self._folders.get(folder)
+        if entries is not None:
+            return entries
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM datasets WHERE folder = ?", (folder,)
+            ).fetchall()
+        entries = {}
+        for row in rows:
+            record = dict(zip(COLUMNS, row))
+            record['schema'] = json.loads(record['schema']) if record['schema'] else None
+            entries[record['name']] = record
+        self._folders[folder] = entries
+
+        if not entries and os.path.isdir(folder):
+            self.sync_folder(folder)
+        # A concurrent write elsewhere may have dropped the mirror while syncing
+        return self._folders.get(folder, entries)
+
+    def upsert(self, file_path, rows=None, schema=None):
+
+        file_path = os.path.abspath(file_path)
+        folder = os.path.dirname(file_path)
+        name = os.path.basename(file_path)
+        stat = os.stat(file_path)
+
+        with self._lock:
+            self._check_version()
+            entries = self._load_folder(folder)
+            previous = entries.get(name)
+            fingerprint = dataset_fingerprint(file_path)
+            # Keep what ingestion learned about the file unless it has changed since
+            if previous and previous['fingerprint'] == fingerprint:
+                rows = rows if rows is not None else previous['rows']
+                schema = schema if schema is not None else previous['schema']
+
+            record = {
+                'path': file_path,
+                'folder': folder,
+                'name': name,
+                'type': DATASET_TYPES.get(os.path.splitext(name)[1].lower()),
+                'size': stat.st_size,
+                'rows': rows,
+                'schema': schema,
+                'fingerprint': fingerprint,
+                'uploaded_at': stat.st_mtime,
+            }
+            with self._connect() as conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO datasets ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                    tuple(json.dumps(record[c]) if c == 'schema' and record[c] is not None else record[c] for c in COLUMNS),
+                )
+                self._bump_version(conn)
+            entries[name] = record
+            return dict(record)
+
+    def remove(self, file_path):
+
+        file_path = os.path.abspath(file_path)
+        folder = os.path.dirname(file_path)
+        with self._lock:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM datasets WHERE path = ?", (file_path,))
+                self._bump_version(conn)
+            self._folders.get(folder, {}).pop(os.path.basename(file_path), None)
+
+    def sync_folder(self, folder):
+        """Reconcile the catalog with what is actually on disk in ``folder``."""
+
+        folder = os.path.abspath(folder)
+        with self._lock:
+            entries = self._folders.setdefault(folder, {})
+            on_disk = set()
+            with os.scandir(folder) as it:
+                for entry in it:
+                    # Dotfiles are uploads still being written and validated
+                    if entry.is_file() and not entry.name.startswith('.'):
+                        on_disk.add(entry.name)
+                        known = entries.get(entry.name)
+                        if known is None or known['fingerprint'] != dataset_fingerprint(entry.path):
+                            self.upsert(entry.path)
+            for name in set(entries) - on_disk:
+                self.remove(os.path.join(folder, name))
+
+    def list_datasets(self, folder, dataset_type=None):
+        """Catalog records for ``folder``, newest upload first."""
+
+        with self._lock:
+            self._check_version()
+            records = [dict(r) for r in self._load_folder(os.path.abspath(folder)).values()]
+        if dataset_type is not None:
+            records = [r for r in records if r['type'] == dataset_type]
+        records.sort(key=lambda r: r['uploaded_at'], reverse=True)
+        return records
+
+
+catalog = DatasetCatalog()
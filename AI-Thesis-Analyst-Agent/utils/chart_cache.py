@@ -0,0 +1,84 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict, namedtuple
+from utils.code_executor import code_hash
+from utils.data_processor import dataset_fingerprint
+
+CHART_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+ChartEntry = namedtuple('ChartEntry', ['etag', 'payload', 'gzipped'])
+
+
+def chart_key(question, csv_files, code_string=None, mode='pandas'):
+    """Key on the question, the analysis code (if any) and the current version of every dataset."""
+
+    fingerprints = sorted(dataset_fingerprint(path) for path in csv_files)
+    code = code_hash(code_string) if code_string is not None else ''
+    raw = '|'.join([mode, code, question.strip()] + fingerprints)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ChartCache:
+    """LRU of serialized chart specs, bounded by bytes.
+
+    Each entry keeps its JSON, a gzipped copy and a strong ETag (a hash of the JSON), so
+    ``/charts/<id>`` can answer re-polls with 304 or pre-compressed bytes and no rendering.
+    """
+
+    def __init__(self, max_bytes=CHART_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def entry(self, key):
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry
+
+    def get(self, key):
+
+        entry = self.entry(key)
+        return json.loads(entry.payload) if entry is not None else None
+
+    def put(self, key, spec):
+        """Store ``spec`` under ``key`` and return it with its ``id`` (the key) added.
+
+        A spec too large to store comes back unchanged, without an ``id``: it can only be
+        sent inline, since /charts/<id> would have nothing to serve.
+        """
+
+        stored = dict(spec, id=key)
+        payload = json.dumps(stored, separators=(',', ':')).encode('utf-8')
+        entry = ChartEntry(hashlib.sha256(payload).hexdigest()[:32], payload, gzip.compress(payload, 6))
+        size = len(entry.payload) + len(entry.gzipped)
+        if size > self.max_bytes:
+            return spec
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous.payload) + len(previous.gzipped)
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.payload) + len(evicted.gzipped)
+        return stored
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+chart_cache = ChartCache()
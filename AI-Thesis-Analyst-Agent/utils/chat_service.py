@@ -1,116 +1,455 @@
 import os
 import json
-import requests
-from utils.data_processor import get_file_content, process_csv_data
-from utils.code_executor import execute_pandas_code
-from utils.visualization import generate_plotly_chart
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.data_processor import get_file_content, process_csv_data, load_dataset
+from utils.code_executor import execute_pandas_code, USE_SANDBOX
+from utils.visualization import generate_chart_spec
+from utils.retrieval import retrieve_passages
+from utils.catalog import catalog
+from utils.chart_cache import chart_cache, chart_key
+from utils.llm_cache import response_cache, cache_key
+from utils.llm_client import get_client, LLMError, LLMTimeoutError, LLMBusyError
+from utils.model_router import ModelRouter
+from utils.profiler import get_profile, answer_from_profile
+from utils.prompt_builder import build_text_prompt, build_code_prompt, build_sql_prompt
+from utils.sql_engine import sql_available
 
 # Configure models based on your specific APIs
+# (environment variables override, e.g. to point at tools/mock_llm_server.py)
 MODELS = {
     'deepseek': {
-        'api_url': 'YOUR_DEEPSEEK_API_URL',
-        'api_key': 'YOUR_DEEPSEEK_API_KEY'
+        'api_url': os.environ.get('DEEPSEEK_API_URL', 'YOUR_DEEPSEEK_API_URL'),
+        'api_key': os.environ.get('DEEPSEEK_API_KEY', 'YOUR_DEEPSEEK_API_KEY')
     },
     'qwen': {
-        'api_url': 'YOUR_QWEN_API_URL',
-        'api_key': 'YOUR_QWEN_API_KEY'
+        'api_url': os.environ.get('QWEN_API_URL', 'YOUR_QWEN_API_URL'),
+        'api_key': os.environ.get('QWEN_API_KEY', 'YOUR_QWEN_API_KEY')
     },
     'yandexGPT': {
-        'api_url': 'YOUR_YANDEX_API_URL',
-        'api_key': 'YOUR_YANDEX_API_KEY'
+        'api_url': os.environ.get('YANDEX_API_URL', 'YOUR_YANDEX_API_URL'),
+        'api_key': os.environ.get('YANDEX_API_KEY', 'YOUR_YANDEX_API_KEY')
     }
 }
 
+# Tracks latency and errors per provider in MODELS to route, hedge and eject
+router = ModelRouter(MODELS)
 
-def chat_respond(question, user_files_path, model='deepseek'):
+# Shared by all requests so the text and code calls of one question run side by side
+_llm_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='llm')
+
+# Language the model writes its analysis in: DuckDB SQL over the cached datasets when
+# available, with generated pandas code as the fallback
+ANALYSIS_MODE = os.environ.get('AI_ANALYST_ANALYSIS_MODE', 'sql' if sql_available() else 'pandas')
+
+# Questions of one batch answered at a time; each has up to two LLM calls in flight,
+# which keeps a batch within a provider's in-flight cap
+BATCH_CONCURRENCY = 4
+
+
+def _gather_files(user_files_path):
     
-    # 1. Extract content from uploaded files
-    file_contents = {}
     csv_files = []
-    pdf_contents = []
+    text_files = []
+    profiles = {}
+    other_files = []
+    json_passages = []
     
-    for filename in os.listdir(user_files_path):
-        file_path = os.path.join(user_files_path, filename)
-        if filename.endswith('.csv'):
+    for record in catalog.list_datasets(user_files_path):
+        filename, file_path = record['name'], record['path']
+        if not os.path.exists(file_path):
+            # Deleted behind the catalog's back: drop it rather than fail the whole request
+            print(f"Dataset missing from disk, removing from catalog: {file_path}")
+            catalog.remove(file_path)
+            continue
+        if record['type'] == 'csv':
+            try:
+                # Describe the data through its profile rather than raw preview rows
+                profiles[filename] = get_profile(file_path)
+            except FileNotFoundError:
+                print(f"Dataset removed while profiling: {file_path}")
+                continue
             csv_files.append(file_path)
-            # Store a preview for context
-            file_contents[filename] = get_file_content(file_path, 'csv', preview=True)
-        elif filename.endswith('.pdf'):
-            pdf_content = get_file_content(file_path, 'pdf')
-            pdf_contents.append(pdf_content)
-            file_contents[filename] = "PDF document loaded"
-        elif filename.endswith(('.txt', '.json')):
-            file_contents[filename] = get_file_content(file_path, os.path.splitext(filename)[1][1:])
-    
-    # 2. Prepare context for the LLM
-    context = f"""
-    User question: {question}
-    
-    Available files:
-    {json.dumps(file_contents, indent=2)}
-    
-    PDF contents summary:
-    {' '.join(pdf_contents)[:2000]}  # Limit context size
+        elif record['type'] in ('pdf', 'txt'):
+            text_files.append(file_path)
+            other_files.append(filename)
+        elif record['type'] == 'json':
+            other_files.append(filename)
+            json_passages.append({'source': filename, 'text': json.dumps(get_file_content(file_path, 'json'))})
+    
+    return csv_files, text_files, profiles, other_files, json_passages
+
+
+def _cached_chart(timings, key, df_result, question, column_info):
+    
+    chart = _timed(timings, 'chart', generate_chart_spec, df_result, question, column_info)
+    # Cached charts carry their key as 'id', so clients can re-poll /charts/<id>
+    return chart_cache.put(key, chart) if chart is not None else None
+
+
+def _answer_from_profiles(question, profiles, column_info, csv_files, use_cache=True):
+    
+    # Simple counting questions are answered straight from the profiles, no LLM or scan needed
+    for filename, profile in profiles.items():
+        counts = answer_from_profile(question, profile)
+        if counts is not None:
+            col = counts.columns[0]
+            text_response = f"Counts of {col} in {filename}:\n" + '\n'.join(
+                f"{value}: {n}" for value, n in zip(counts[col], counts['count'])
+            )
+            key = chart_key(question, csv_files)
+            chart = chart_cache.get(key) if use_cache else None
+            if chart is None:
+                chart = _cached_chart(None, key, counts, question, column_info)
+            return text_response, chart
+    return None
+
+
+def _text_context(question, text_files, profiles, other_files, json_passages):
+    
+    # Pull only the document passages relevant to the question; the prompt builder
+    # then keeps as many of them as the token budget allows
+    passages = retrieve_passages(question, text_files, k=5, budget_chars=8000) + json_passages
+    return build_text_prompt(question, profiles, passages, other_files)
+
+
+def _timed(timings, stage, fn, *args, **kwargs):
+    
+    # Record how long a pipeline stage took, when the caller asked for timings
+    start = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        if timings is not None:
+            timings[stage] = time.perf_counter() - start
+
+
+def _request_code(question, profiles, csv_files, model, use_cache, mode, timings=None):
+    
+    # Returns the future of the generated code, plus (in SQL mode) a way to ask for
+    # pandas code instead should the query fail
+    if mode == 'sql':
+        prompt, response_type = build_sql_prompt(question, profiles, csv_files), 'sql'
+        fallback = lambda: complete_llm(
+            build_code_prompt(question, profiles, csv_files),
+            model=model, response_type='code', datasets=csv_files, use_cache=use_cache
+        )
+    else:
+        prompt, response_type = build_code_prompt(question, profiles, csv_files), 'code'
+        fallback = None
+    # The future raises LLMError if no provider answered
+    code_future = _llm_pool.submit(
+        _timed, timings, 'code_llm', complete_llm, prompt,
+        model=model, response_type=response_type, datasets=csv_files, use_cache=use_cache
+    )
+    return code_future, fallback
+
+
+def _chart_from_code(code_future, question, csv_files, column_info, timings=None, frames=None,
+                     mode='pandas', fallback=None, use_cache=True):
+    
+    try:
+        code = code_future.result()
+    except LLMError as e:
+        print(f"No analysis code generated: {str(e)}")
+        return None
+    # Same code over unchanged datasets draws the same chart
+    key = chart_key(question, csv_files, code, mode)
+    chart = chart_cache.get(key) if use_cache else None
+    if chart is not None:
+        return chart
+    df_result = _timed(
+        timings, 'execute', execute_pandas_code, code, csv_files, frames, use_cache=use_cache, mode=mode
+    )
+    if df_result is None and fallback is not None:
+        # The pandas path stays as the fallback for anything the SQL engine can't answer
+        try:
+            pandas_code = _timed(timings, 'fallback_llm', fallback)
+        except LLMError as e:
+            print(f"No fallback pandas code generated: {str(e)}")
+            return None
+        df_result = _timed(
+            timings, 'fallback_execute', execute_pandas_code, pandas_code, csv_files, frames, use_cache=use_cache
+        )
+    if df_result is None:
+        return None
+    return _cached_chart(timings, key, df_result, question, column_info)
+
+
+def _column_info(profiles):
+    
+    # Columns seen across all datasets, used to pick chart types without re-inferring dtypes
+    return {col: info for profile in profiles.values() for col, info in profile['columns'].items()}
+
+
+def _respond(question, files, column_info, model, use_cache, timings=None, frames=None, mode=None):
+    
+    csv_files, text_files, profiles, other_files, json_passages = files
+    
+    answer = _answer_from_profiles(question, profiles, column_info, csv_files, use_cache)
+    if answer is not None:
+        return answer
+    
+    # 2. If a CSV file is available, ask LLM to generate SQL or pandas code for analysis.
+    # The code prompt doesn't depend on the narrative answer, so it goes out first
+    # and runs alongside retrieval and the text call
+    mode = mode or ANALYSIS_MODE
+    code_future = None
+    if csv_files:
+        code_future, fallback = _request_code(question, profiles, csv_files, model, use_cache, mode, timings)
+    
+    # 3. Prepare context for the LLM
+    context = _timed(timings, 'prompt', _text_context, question, text_files, profiles, other_files, json_passages)
+    
+    # 4. Get text answer from LLM, in the background
+    text_future = _llm_pool.submit(
+        _timed, timings, 'text_llm', query_llm, context,
+        model=model, datasets=csv_files + text_files, use_cache=use_cache
+    )
+    
+    # 5. Execute the generated code and chart it as soon as the code arrives,
+    # while the text answer may still be generating
+    chart = None
+    if code_future is not None:
+        chart = _chart_from_code(
+            code_future, question, csv_files, column_info, timings, frames, mode, fallback, use_cache
+        )
+    
+    text_response = text_future.result()
+    
+    return text_response, chart
+
+
+def chat_respond(question, user_files_path, model='deepseek', use_cache=True, timings=None, mode=None):
+    """Answer ``question`` over the uploads in ``user_files_path``.
+
+    Pass a dict as ``timings`` to have it filled with per-stage durations in seconds.
+    ``mode`` is ``'sql'`` or ``'pandas'`` (default ANALYSIS_MODE): the language the model
+    writes its analysis in.
+    """
+    
+    start = time.perf_counter()
+    
+    # 1. Extract content from uploaded files
+    files = _timed(timings, 'files', _gather_files, user_files_path)
+    
+    result = _respond(question, files, _column_info(files[2]), model, use_cache, timings, mode=mode)
+    
+    if timings is not None:
+        timings['total'] = time.perf_counter() - start
+    return result
+
+
+def chat_respond_batch(questions, user_files_path, model='deepseek', use_cache=True,
+                       max_concurrency=BATCH_CONCURRENCY, mode=None):
+    """Answer many questions over the same uploads, yielding each result as soon as it is ready.
+
+    The folder is listed and profiled once for the whole batch, and at most
+    ``max_concurrency`` questions are in flight at a time. When generated code runs in
+    this process (AI_ANALYST_SANDBOX=0) the datasets are also loaded once and shared by
+    every question; sandbox workers read them from their own memory-mapped cache instead. Yields dicts with ``index``,
+    ``question``, ``bot_response``, ``chart`` and ``timings``, in completion order.
+    """
+    
+    files = _gather_files(user_files_path)
+    column_info = _column_info(files[2])
+    # Pinned for the batch so in-process code never waits on the dataset cache; workers
+    # can't be handed these, so with the sandbox on they would only cost memory
+    frames = None if USE_SANDBOX else {path: load_dataset(path) for path in files[0]}
+    
+    # Repeated questions are answered once and reported under every index
+    indexes = {}
+    for index, question in enumerate(questions):
+        indexes.setdefault(question, []).append(index)
+    
+    def answer(question):
+        timings = {}
+        start = time.perf_counter()
+        try:
+            text_response, chart = _respond(
+                question, files, column_info, model, use_cache, timings, frames, mode
+            )
+        except Exception as e:
+            print(f"Error answering batch question: {str(e)}")
+            text_response, chart = "I encountered an error while processing your request.", None
+        timings['total'] = time.perf_counter() - start
+        return question, text_response, chart, timings
+    
+    pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix='batch')
+    try:
+        futures = [pool.submit(answer, question) for question in indexes]
+        for future in as_completed(futures):
+            question, text_response, chart, timings = future.result()
+            for index in indexes[question]:
+                yield {
+                    'index': index,
+                    'question': question,
+                    'bot_response': text_response,
+                    'chart': chart,
+                    'timings': timings,
+                }
+    finally:
+        # A consumer that stops early (e.g. a disconnected client) drops the questions not yet started
+        pool.shutdown(cancel_futures=True)
+
+
+def chat_respond_stream(question, user_files_path, model='deepseek', use_cache=True, mode=None):
+    """Like chat_respond, but yields ``(event, data)`` pairs as results become available.
+
+    Events are ``token`` (a piece of the text answer), ``chart`` (a Plotly figure spec) and ``done``.
     """
     
-    # 3. Get text answer from LLM
-    text_response = query_llm(context, model=model)  # Or use any model preference logic
+    csv_files, text_files, profiles, other_files, json_passages = _gather_files(user_files_path)
+    column_info = _column_info(profiles)
+    
+    answer = _answer_from_profiles(question, profiles, column_info, csv_files, use_cache)
+    if answer is not None:
+        yield 'token', answer[0]
+        yield 'chart', answer[1]
+        yield 'done', None
+        return
     
-    # 4. If a CSV file is available, ask LLM to generate pandas code for analysis
-    chart_html = ""
+    # Code generation, execution and charting all happen off the streaming thread
+    mode = mode or ANALYSIS_MODE
+    chart_future = None
     if csv_files:
-        code_prompt = f"""
-        Based on the user's question: "{question}"
-        
-        Generate Python pandas code to analyze the following CSV files:
-        {', '.join([os.path.basename(f) for f in csv_files])}
-        
-        The code should:
-        1. Load the CSV data
-        2. Process and aggregate as needed
-        3. Create a plotly visualization that answers the question
-        4. Return only the pandas and plotly code without explanations
-        
-        Here's a preview of the data:
-        {json.dumps({os.path.basename(f): file_contents[os.path.basename(f)] for f in csv_files}, indent=2)}
-        """
-        
-        pandas_code = query_llm(code_prompt, model=model, response_type='code')
-        
-        # 5. Execute generated pandas code safely
-        df_result = execute_pandas_code(pandas_code, csv_files)
-        
-        # 6. Generate plotly visualization
-        if df_result is not None:
-            chart_html = generate_plotly_chart(df_result, question)
-    
-    return text_response, chart_html
-
-def query_llm(prompt, model='deepseek', response_type='text'):
-    
-    model_config = MODELS.get(model, MODELS['deepseek'])
-    
-   
+        code_future, fallback = _request_code(question, profiles, csv_files, model, use_cache, mode)
+        chart_future = _llm_pool.submit(
+            _chart_from_code, code_future, question, csv_files, column_info,
+            mode=mode, fallback=fallback, use_cache=use_cache
+        )
+    
+    context = _text_context(question, text_files, profiles, other_files, json_passages)
+    for token in query_llm_stream(context, model=model, datasets=csv_files + text_files, use_cache=use_cache):
+        yield 'token', token
+    
+    if chart_future is not None:
+        chart = chart_future.result()
+        if chart:
+            yield 'chart', chart
+    yield 'done', None
+
+
+def _error_message(e):
+    
+    if isinstance(e, LLMTimeoutError):
+        print(f"LLM timed out: {str(e)}")
+        return "The model took too long to respond, please try again."
+    if isinstance(e, LLMBusyError):
+        print(f"LLM busy: {str(e)}")
+        return "The model is handling too many requests right now, please try again shortly."
+    print(f"Error querying LLM: {str(e)}")
+    return "I encountered an error while processing your request."
+
+
+def _preferred_model(model):
+    
+    if model in MODELS:
+        return model
+    # No silent pinning to one provider: let the router pick the healthiest
+    print(f"Unknown model '{model}', routing to the healthiest provider")
+    return None
+
+
+def _cached_answer(prompt, preferred, response_type, datasets):
+    
+    # Answers are stored under the provider that actually gave them, so a request for one
+    # model is never served another's answer; with no preference any provider's will do
+    for name in ([preferred] if preferred else list(MODELS)):
+        cached = response_cache.get(cache_key(name, response_type, prompt, datasets))
+        if cached is not None:
+            return cached
+    return None
+
+
+def query_llm(prompt, model='deepseek', response_type='text', datasets=(), use_cache=True):
+    
+    try:
+        return complete_llm(prompt, model, response_type, datasets, use_cache)
+    except LLMError as e:
+        return _error_message(e)
+
+
+def complete_llm(prompt, model='deepseek', response_type='text', datasets=(), use_cache=True):
+    """Like query_llm, but raises LLMError instead of returning a message for the user.
+
+    Used where the answer is code to run, which an error message must never be mistaken for.
+    """
+    
+    preferred = _preferred_model(model)
+    
+    # Identical prompts over unchanged data get the stored answer back
+    if use_cache:
+        cached = _cached_answer(prompt, preferred, response_type, datasets)
+        if cached is not None:
+            return cached
+    
+    def complete(name):
+        return get_client(name, MODELS[name]).complete(
+            prompt,
+            max_tokens=1000,
+            temperature=0.3 if response_type in ('code', 'sql') else 0.7
+        )
+    
+    # The preferred provider goes first if healthy; slow calls are hedged and
+    # failures fall through to the other providers
+    name, result = router.call(complete, preferred)
+    
+    # Only real answers are stored; error messages are never cached
+    response_cache.put(cache_key(name, response_type, prompt, datasets), result)
+    return result
+
+
+def _open_stream(prompt, preferred, temperature):
+    
+    # Fail over between providers until one produces its first token; after that
+    # the stream is committed to that provider, which counts it as in flight until the
+    # caller calls router.finished(name)
+    last_error = LLMError("No providers configured")
+    for name in router.order(preferred):
+        stream = get_client(name, MODELS[name]).stream(prompt, max_tokens=1000, temperature=temperature)
+        start = time.monotonic()
+        router.started(name)
+        try:
+            first = next(stream, '')
+        except LLMError as e:
+            router.record(name, time.monotonic() - start, False)
+            router.finished(name)
+            last_error = e
+            continue
+        router.record(name, time.monotonic() - start, True)
+        return name, first, stream
+    raise last_error
+
+
+def query_llm_stream(prompt, model='deepseek', response_type='text', datasets=(), use_cache=True):
+    
+    preferred = _preferred_model(model)
+    
+    if use_cache:
+        cached = _cached_answer(prompt, preferred, response_type, datasets)
+        if cached is not None:
+            yield cached
+            return
+    
+    tokens = []
+    try:
+        name, first, stream = _open_stream(prompt, preferred, 0.3 if response_type in ('code', 'sql') else 0.7)
+    except LLMError as e:
+        yield _error_message(e)
+        return
     try:
-        
-        headers = {
-            'Authorization': f"Bearer {model_config['api_key']}",
-            'Content-Type': 'application/json'
-        }
-        
-        data = {
-            'prompt': prompt,
-            'max_tokens': 1000,
-            'temperature': 0.3 if response_type == 'code' else 0.7
-        }
-        
-        response = requests.post(model_config['api_url'], headers=headers, json=data)
-        response.raise_for_status()
-        
-       
-        result = response.json().get('choices', [{}])[0].get('text', '')
-        return result.strip()
-        
-    except Exception as e:
-        print(f"Error querying LLM: {str(e)}")
-        return "I encountered an error while processing your request."
+        if first:
+            tokens.append(first)
+            yield first
+        for token in stream:
+            tokens.append(token)
+            yield token
+    except LLMError as e:
+        yield _error_message(e)
+        return
+    finally:
+        router.finished(name)
+    
+    # Stored stripped, the same as a non-streamed answer
+    response_cache.put(cache_key(name, response_type, prompt, datasets), ''.join(tokens).strip())
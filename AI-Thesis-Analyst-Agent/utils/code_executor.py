@@ -1,69 +1,233 @@
 import pandas as pd
 import os
 import ast
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
 from io import StringIO
-import sys
 import traceback
+from utils.code_rewriter import rewrite_code
+from utils.data_processor import (
+    load_dataset, frame_view, open_dataset_table, read_dataset, frame_mask, dataset_fingerprint
+)
+from utils.executor_pool import get_pool, ExecutionError, encode_result, decode_result
+from utils.sql_engine import run_sql, SQLError
 
-def execute_pandas_code(code_string, csv_files):
+# Generated code runs in isolated worker processes unless AI_ANALYST_SANDBOX=0
+USE_SANDBOX = os.environ.get('AI_ANALYST_SANDBOX', '1') != '0'
+
+COMPILED_CACHE_ENTRIES = 256
+RESULT_CACHE_ENTRIES = 256
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Cached results are stored as compressed Arrow streams
+RESULT_COMPRESSION = 'lz4'
+
+_compiled = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+def code_hash(code_string):
+    """Hash of the code's syntax tree, so formatting and comments don't change it."""
+
+    try:
+        normalized = ast.unparse(ast.parse(code_string))
+    except SyntaxError:
+        normalized = code_string
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def _versioned_key(code_string, csv_files, mode='pandas'):
+
+    # The rewritten code and its result both depend on the current version of every dataset
+    fingerprints = sorted(dataset_fingerprint(path) for path in csv_files)
+    raw = '|'.join([mode, code_hash(code_string)] + fingerprints)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """LRU of ``result_df`` values as compact columnar blobs, bounded by count and bytes."""
+
+    def __init__(self, max_entries=RESULT_CACHE_ENTRIES, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, key):
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+        # Every hit decodes a fresh frame, so callers can't modify the cached one
+        return decode_result(*entry)
+
+    def put(self, key, result_df):
+
+        kind, payload = encode_result(result_df, compression=RESULT_COMPRESSION)
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[1])
+            self._entries[key] = (kind, payload)
+            self._bytes += len(payload)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+result_cache = ResultCache()
+
+
+class CachedPandas:
+    """Proxy for the pandas module whose read_csv serves uploads from the dataset cache.
+
+    ``frames`` maps paths to frames already in memory (e.g. shared by a batch of
+    questions); those are served without touching the cache at all.
+    """
+
+    def __init__(self, csv_files, frames=None):
+        self._cached_paths = {os.path.abspath(f) for f in csv_files}
+        self._frames = {os.path.abspath(path): df for path, df in (frames or {}).items()}
+
+    def read_csv(self, filepath_or_buffer, *args, **kwargs):
+        path = filepath_or_buffer
+        if isinstance(path, str) and os.path.abspath(path) in self._cached_paths:
+            usecols = kwargs.pop('usecols', None)
+            # Anything beyond a column selection changes parsing, so let pandas handle it
+            if not args and not kwargs and (usecols is None or not callable(usecols)):
+                frame = self._frames.get(os.path.abspath(path))
+                if frame is not None:
+                    return frame_view(frame, usecols)
+                return load_dataset(path, columns=usecols)
+            if usecols is not None:
+                kwargs['usecols'] = usecols
+        return pd.read_csv(filepath_or_buffer, *args, **kwargs)
+
+    def read_cached(self, path, columns=None, where=None):
+        # Emitted by the code rewriter in place of read_csv calls it could narrow down
+        frame = self._frames.get(os.path.abspath(path))
+        if frame is not None:
+            if where is not None:
+                frame = frame[frame_mask(frame, where)]
+            return frame_view(frame, columns)
+        return read_dataset(path, columns=columns, where=where)
+
+    def __getattr__(self, name):
+        return getattr(pd, name)
+
+
+def _compiled_code(code_string, file_dict, use_cache=True):
+
+    key = _versioned_key(code_string, file_dict.values())
+    with _compiled_lock:
+        code = _compiled.get(key) if use_cache else None
+        if code is not None:
+            _compiled.move_to_end(key)
+            return code
+
+    code = compile(preprocess_code(code_string, file_dict), '<generated>', 'exec')
+    with _compiled_lock:
+        _compiled[key] = code
+        while len(_compiled) > COMPILED_CACHE_ENTRIES:
+            _compiled.popitem(last=False)
+    return code
+
+
+def run_code(code_string, csv_files, frames=None, stdout=None, use_cache=True):
+    """Execute generated code in this process and return its ``result_df`` (None if it sets none).
+
+    Errors propagate to the caller; output of ``print`` goes to ``stdout``. With
+    ``use_cache=False`` the code is compiled afresh instead of taken from the compiled cache.
+    """
     
     file_dict = {os.path.basename(f): f for f in csv_files}
     
-    
     safe_globals = {
-        'pd': pd,
+        'pd': CachedPandas(csv_files, frames),
         'os': os,
         'file_dict': file_dict,
-        'print': print,
+        'print': functools.partial(print, file=stdout if stdout is not None else StringIO()),
     }
     
+    exec(_compiled_code(code_string, file_dict, use_cache), safe_globals)
+    return safe_globals.get('result_df')
+
+
+def execute_pandas_code(code_string, csv_files, frames=None, use_cache=True, mode='pandas'):
+    """Run generated code and return its ``result_df``, or None if it failed.
+
+    By default the code runs in the sandboxed worker pool (utils/executor_pool.py), where
+    the datasets come from the workers' own memory-mapped cache and ``frames`` is unused;
+    with AI_ANALYST_SANDBOX=0 it runs in this process. With ``mode='sql'`` the code is a
+    DuckDB query over the cached datasets instead (utils/sql_engine.py). Results of the
+    same code over unchanged datasets are served from ``result_cache`` without running anything.
+    """
     
-    old_stdout = sys.stdout
-    mystdout = StringIO()
-    sys.stdout = mystdout
+    key = _versioned_key(code_string, csv_files, mode)
+    if use_cache:
+        cached = result_cache.get(key)
+        if cached is not None:
+            return cached
     
-    result_df = None
+    if mode == 'sql':
+        result_df = _execute_sql(code_string, csv_files)
+    else:
+        result_df = _execute(code_string, csv_files, frames, use_cache)
+    # Failures are never cached, so a retry gets a fresh run
+    if result_df is not None:
+        result_cache.put(key, result_df)
+    return result_df
+
+
+def _execute_sql(sql, csv_files):
     
     try:
-       
-        processed_code = preprocess_code(code_string, file_dict)
-        
-       
-        exec(processed_code, safe_globals)
-        
-        
-        if 'result_df' in safe_globals:
-            result_df = safe_globals['result_df']
-        
+        return run_sql(sql, csv_files)
+    except SQLError as e:
+        print(f"Error executing SQL: {str(e)}")
+        return None
+
+
+def _execute(code_string, csv_files, frames, use_cache=True):
+    
+    if USE_SANDBOX:
+        try:
+            return get_pool().execute(code_string, csv_files, use_cache=use_cache).result_df
+        except ExecutionError as e:
+            print(f"Error executing code: {str(e)}")
+            return None
+    
+    # The code's own output is captured per call; swapping sys.stdout would leak between
+    # concurrent requests. Failures are reported like the sandbox path's, plus the traceback
+    mystdout = StringIO()
+    try:
+        return run_code(code_string, csv_files, frames, mystdout, use_cache)
     except Exception as e:
-        print(f"Error executing code: {str(e)}")
+        print(f"Error executing code: {type(e).__name__}: {str(e)}")
         traceback.print_exc()
-    finally:
-        
-        sys.stdout = old_stdout
-    
-    return result_df
+        return None
+
 
 def preprocess_code(code_string, file_dict):
+    """Validated and rewritten form of the generated code, as an ``ast.Module``.
+
+    File names become the cached dataset paths, and reads only fetch the columns and
+    rows the code goes on to use (see utils/code_rewriter.py).
+    """
     
-    for filename, filepath in file_dict.items():
-        code_string = code_string.replace(f'"{filename}"', f'file_dict["{filename}"]')
-        code_string = code_string.replace(f"'{filename}'", f'file_dict["{filename}"]')
-    
-   
-    if 'result_df' not in code_string:
-        
-        lines = code_string.split('\n')
-        df_candidates = []
-        
-        for line in lines:
-            if 'fig' in line and '.plot(' in line:
-                parts = line.split('.plot(')
-                if parts and parts[0].strip():
-                    df_candidates.append(parts[0].strip())
-        
-        
-        if df_candidates:
-            code_string += f"\nresult_df = {df_candidates[-1]}"
-    
-    return code_string
+    return rewrite_code(code_string, file_dict, lambda path: open_dataset_table(path).schema)
@@ -0,0 +1,416 @@
+import ast
+import inspect
+import os
+import pandas as pd
+import pyarrow as pa
+
+# Modules generated code may import; everything else is refused
+ALLOWED_IMPORTS = {
+    'pandas', 'numpy', 'math', 'statistics', 'datetime', 're', 'json',
+    'collections', 'itertools', 'functools', 'scipy',
+}
+# Charts are drawn by the app from result_df, so statements using these are dropped, not refused
+PLOTTING_MODULES = {'plotly', 'matplotlib', 'seaborn'}
+# The only os attributes generated code may touch: os.path.<function>
+OS_PATH_FUNCTIONS = {
+    name for name, value in vars(os.path).items()
+    if not name.startswith('_') and callable(value) and not inspect.ismodule(value)
+}
+BLOCKED_NAMES = {
+    '__import__', '__builtins__', 'eval', 'exec', 'compile', 'open', 'input', 'breakpoint',
+    'globals', 'locals', 'vars', 'getattr', 'setattr', 'delattr', 'exit', 'quit',
+}
+# pandas/numpy ``to_*`` conversions that stay in memory. Every other ``to_*`` (to_csv, to_json,
+# to_html, ...) can write to a path or buffer and is refused
+IN_MEMORY_CONVERSIONS = {
+    'to_numpy', 'to_list', 'to_dict', 'to_frame', 'to_records', 'to_series', 'to_flat_index',
+    'to_datetime', 'to_numeric', 'to_timedelta', 'to_period', 'to_timestamp', 'to_pydatetime',
+    'to_pytimedelta', 'to_offset', 'to_tuples',
+}
+# Other calls that write files, unpickle arbitrary data or run commands
+BLOCKED_ATTRIBUTES = {
+    'read_pickle', 'read_sql', 'save', 'savetxt', 'savez', 'savez_compressed', 'tofile', 'dump',
+    'load', 'system', 'popen',
+}
+
+_ALLOWED_NODES = tuple(getattr(ast, name) for name in (
+    'Module', 'Expr', 'Assign', 'AugAssign', 'AnnAssign', 'For', 'While', 'If', 'Break',
+    'Continue', 'Pass', 'Return', 'FunctionDef', 'Lambda', 'Import', 'ImportFrom', 'alias',
+    'Try', 'ExceptHandler', 'Raise', 'Delete', 'Assert',
+    'BoolOp', 'BinOp', 'UnaryOp', 'IfExp', 'Dict', 'Set', 'ListComp', 'SetComp', 'DictComp',
+    'GeneratorExp', 'comprehension', 'Compare', 'Call', 'keyword', 'FormattedValue',
+    'JoinedStr', 'Constant', 'Attribute', 'Subscript', 'Starred', 'Name', 'List', 'Tuple',
+    'Slice', 'arguments', 'arg', 'Index', 'ExtSlice',
+    'expr_context', 'boolop', 'operator', 'unaryop', 'cmpop',
+) if hasattr(ast, name))
+
+_FLIPPED = {'==': '==', '!=': '!=', '<': '>', '<=': '>=', '>': '<', '>=': '<='}
+_CMP_OPS = {ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>='}
+
+
+class UnsafeCodeError(ValueError):
+    pass
+
+
+def _slice(node):
+
+    # Python 3.8 wraps subscripts in ast.Index
+    return node.value if type(node).__name__ == 'Index' else node
+
+
+def validate(tree):
+    """Refuse code that uses anything beyond plain data-analysis constructs."""
+
+    parents = _parents(tree)
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise UnsafeCodeError(f"{type(node).__name__} is not allowed in generated code")
+        if isinstance(node, ast.Name) and node.id in BLOCKED_NAMES:
+            raise UnsafeCodeError(f"'{node.id}' is not allowed in generated code")
+        if isinstance(node, ast.Name) and node.id == 'os':
+            # Judge the whole dotted name, so os.path.os.<anything> doesn't pass as os.path
+            chain = _attribute_chain(node, parents)
+            if len(chain) < 2 or chain[0] != 'path' or chain[1] not in OS_PATH_FUNCTIONS:
+                raise UnsafeCodeError("Only os.path functions may be used in generated code")
+        if isinstance(node, ast.Attribute) and (
+                node.attr.startswith('__') or node.attr in BLOCKED_ATTRIBUTES
+                or (node.attr.startswith('to_') and node.attr not in IN_MEMORY_CONVERSIONS)):
+            raise UnsafeCodeError(f"'.{node.attr}' is not allowed in generated code")
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            modules = [node.module] if isinstance(node, ast.ImportFrom) else [a.name for a in node.names]
+            for module in modules:
+                if (module or '').split('.')[0] not in ALLOWED_IMPORTS:
+                    raise UnsafeCodeError(f"Importing '{module}' is not allowed in generated code")
+
+
+def _parents(tree):
+
+    return {child: node for node in ast.walk(tree) for child in ast.iter_child_nodes(node)}
+
+
+def _attribute_chain(node, parents):
+
+    # Attribute names applied to ``node``, outermost last: os.path.join -> ['path', 'join']
+    chain = []
+    parent = parents.get(node)
+    while isinstance(parent, ast.Attribute) and parent.value is node:
+        chain.append(parent.attr)
+        node, parent = parent, parents.get(parent)
+    return chain
+
+
+def _root_name(node):
+
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Call)):
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def strip_plotting(tree):
+    """Drop plotting imports and every statement that uses what they (transitively) bound.
+
+    Returns the name of the last frame handed to a plotting call, or None, so it can
+    stand in for ``result_df`` when the code sets none.
+    """
+
+    tainted = set()
+    plotted = None
+
+    def uses_tainted(node):
+        return any(isinstance(n, ast.Name) and n.id in tainted for n in ast.walk(node))
+
+    def strip(body):
+        nonlocal plotted
+        kept = []
+        for stmt in body:
+            if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+                if isinstance(stmt, ast.ImportFrom):
+                    modules = [stmt.module or ''] * len(stmt.names)
+                else:
+                    modules = [a.name for a in stmt.names]
+                plotting = [a for a, m in zip(stmt.names, modules) if m.split('.')[0] in PLOTTING_MODULES]
+                tainted.update((a.asname or a.name).split('.')[0] for a in plotting)
+                stmt.names = [a for a in stmt.names if a not in plotting]
+                if stmt.names:
+                    kept.append(stmt)
+                continue
+            header = [getattr(stmt, field) for field in ('test', 'iter') if hasattr(stmt, field)]
+            compound = any(hasattr(stmt, field) for field in ('body', 'handlers'))
+            if (compound and any(uses_tainted(h) for h in header)) or (not compound and uses_tainted(stmt)):
+                for node in ast.walk(stmt):
+                    if isinstance(node, ast.Call) and _root_name(node.func) in tainted:
+                        data = node.args[0] if node.args else next(
+                            (k.value for k in node.keywords if k.arg in ('data_frame', 'data')), None
+                        )
+                        name = _root_name(data) if data is not None else None
+                        if name is not None and name not in tainted:
+                            plotted = name
+                tainted.update(
+                    n.id for n in ast.walk(stmt) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)
+                )
+                continue
+            for field in ('body', 'orelse', 'finalbody'):
+                original = getattr(stmt, field, None)
+                if original:
+                    setattr(stmt, field, strip(original) or [ast.copy_location(ast.Pass(), stmt)])
+            for handler in getattr(stmt, 'handlers', []):
+                handler.body = strip(handler.body) or [ast.copy_location(ast.Pass(), handler)]
+            kept.append(stmt)
+        return kept
+
+    tree.body = strip(tree.body)
+    return plotted
+
+
+class _FileAndImportRewriter(ast.NodeTransformer):
+    """Point file literals at the uploaded datasets and keep ``pd`` bound to the cached proxy."""
+
+    def __init__(self, file_dict):
+        self.file_dict = file_dict
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, str):
+            name = os.path.basename(node.value)
+            if name in self.file_dict and node.value.replace('\\', '/').split('/')[-1] == name:
+                return ast.copy_location(ast.Constant(self.file_dict[name]), node)
+        return node
+
+    def visit_Import(self, node):
+        kept = [a for a in node.names if a.name != 'pandas']
+        # `import pandas as pd` would replace the proxy with the real module
+        aliases = [
+            ast.Assign(targets=[ast.Name(a.asname or 'pandas', ast.Store())], value=ast.Name('pd', ast.Load()))
+            for a in node.names if a.name == 'pandas' and (a.asname or 'pandas') != 'pd'
+        ]
+        statements = ([ast.Import(names=kept)] if kept else []) + aliases
+        return [ast.copy_location(s, node) for s in statements] or ast.copy_location(ast.Pass(), node)
+
+
+def _assigned_names(tree):
+
+    return {
+        node.id for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)
+    }
+
+
+def _ensure_result_df(tree, plotted=None):
+
+    if 'result_df' in _assigned_names(tree):
+        return
+    # Prefer whatever the code was about to plot, else its last top-level value or assignment
+    candidate = plotted
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr == 'plot' and isinstance(node.func.value, ast.Name)):
+            candidate = node.func.value.id
+    if candidate is not None:
+        value = ast.Name(candidate, ast.Load())
+    elif tree.body and isinstance(tree.body[-1], ast.Expr):
+        value = tree.body.pop().value
+    else:
+        targets = [
+            s.targets[0].id for s in tree.body
+            if isinstance(s, ast.Assign) and len(s.targets) == 1 and isinstance(s.targets[0], ast.Name)
+        ]
+        if not targets:
+            return
+        value = ast.Name(targets[-1], ast.Load())
+    tree.body.append(ast.Assign(targets=[ast.Name('result_df', ast.Store())], value=value))
+
+
+def _column_ref(node, name, schema):
+    """Column name for ``df['col']`` or ``df.col`` over dataset variable ``name``, else None."""
+
+    if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == name:
+        key = _slice(node.slice)
+        if isinstance(key, ast.Constant) and key.value in schema.names:
+            return key.value
+    if (isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == name
+            and node.attr in schema.names and not hasattr(pd.DataFrame, node.attr)):
+        return node.attr
+    return None
+
+
+def _string_list(node):
+
+    node = _slice(node)
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, (ast.List, ast.Tuple)) and all(
+            isinstance(e, ast.Constant) and isinstance(e.value, str) for e in node.elts):
+        return [e.value for e in node.elts]
+    return None
+
+
+def _comparable(field_type, value, op):
+
+    if isinstance(value, bool):
+        return pa.types.is_boolean(field_type) and op in ('==', '!=')
+    if isinstance(value, (int, float)):
+        return pa.types.is_integer(field_type) or pa.types.is_floating(field_type)
+    if isinstance(value, str):
+        if pa.types.is_dictionary(field_type):
+            # pandas refuses ordering comparisons on unordered categoricals; don't make them work
+            value_type = field_type.value_type
+            return (pa.types.is_string(value_type) or pa.types.is_large_string(value_type)) \
+                and op in ('==', '!=', 'isin')
+        return pa.types.is_string(field_type) or pa.types.is_large_string(field_type)
+    return False
+
+
+def _filter_spec(node, name, schema):
+    """Translate a boolean mask over ``name`` into a filter spec (see data_processor), or None."""
+
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+        left, right = _filter_spec(node.left, name, schema), _filter_spec(node.right, name, schema)
+        if left is None or right is None:
+            return None
+        return ('and' if isinstance(node.op, ast.BitAnd) else 'or', left, right)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Invert):
+        inner = _filter_spec(node.operand, name, schema)
+        return None if inner is None else ('not', inner)
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _CMP_OPS:
+        op = _CMP_OPS[type(node.ops[0])]
+        left, right = node.left, node.comparators[0]
+        column = _column_ref(left, name, schema)
+        if column is None:
+            column, left, right, op = _column_ref(right, name, schema), right, left, _FLIPPED[op]
+        if column is None or not isinstance(right, ast.Constant):
+            return None
+        if not _comparable(schema.field(column).type, right.value, op):
+            return None
+        return ('cmp', column, op, right.value)
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'isin'
+            and len(node.args) == 1 and not node.keywords
+            and isinstance(node.args[0], (ast.List, ast.Tuple, ast.Set))):
+        column = _column_ref(node.func.value, name, schema)
+        values = node.args[0].elts
+        if column is None or not values or not all(isinstance(v, ast.Constant) for v in values):
+            return None
+        field_type = schema.field(column).type
+        if not all(_comparable(field_type, v.value, 'isin') for v in values):
+            return None
+        return ('isin', column, tuple(v.value for v in values))
+    return None
+
+
+def _columns_used(node, parents, schema):
+    """Columns one reference to a dataset variable needs, or None if it needs the whole frame."""
+
+    parent = parents.get(node)
+    if isinstance(parent, ast.Subscript) and parent.value is node:
+        columns = _string_list(parent.slice)
+        if columns is None:
+            return None
+        if not isinstance(parent.ctx, ast.Load):
+            # df['new'] = ... only writes
+            return set()
+        return {c for c in columns if c in schema.names}
+    if isinstance(parent, ast.Attribute) and parent.value is node:
+        if parent.attr in schema.names and not hasattr(pd.DataFrame, parent.attr):
+            return {parent.attr}
+        if parent.attr == 'groupby':
+            call = parents.get(parent)
+            if not isinstance(call, ast.Call) or call.func is not parent:
+                return None
+            by = call.args[0] if call.args else next((k.value for k in call.keywords if k.arg == 'by'), None)
+            keys = _string_list(by) if by is not None else None
+            if keys is None:
+                return None
+            keys = {k for k in keys if k in schema.names}
+            # Only a groupby that selects its columns stays narrow; .mean() etc. touch every column
+            selector = parents.get(call)
+            if isinstance(selector, ast.Subscript) and selector.value is call:
+                selected = _string_list(selector.slice)
+                return None if selected is None else keys | {c for c in selected if c in schema.names}
+            if isinstance(selector, ast.Attribute) and selector.attr == 'size':
+                return keys
+        return None
+    if (isinstance(parent, ast.Call) and isinstance(parent.func, ast.Name) and parent.func.id == 'len'
+            and parent.args == [node]):
+        return set()
+    return None
+
+
+def _is_cached_read(node, file_paths):
+
+    return (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and isinstance(node.func.value, ast.Name) and node.func.value.id == 'pd'
+            and node.func.attr == 'read_csv' and len(node.args) == 1 and not node.keywords
+            and isinstance(node.args[0], ast.Constant) and node.args[0].value in file_paths)
+
+
+def _push_down_reads(tree, file_paths, schema_of):
+    """Turn ``df = pd.read_csv(path)`` into ``pd.read_cached(path, columns=..., where=...)``.
+
+    The columns are those the rest of the code provably reads from ``df``; a row filter
+    ``df = df[mask]`` right after the read is folded into it when the mask is a simple
+    comparison of columns against constants.
+    """
+
+    body = tree.body
+    i = 0
+    while i < len(body):
+        statement = body[i]
+        if not (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                and isinstance(statement.targets[0], ast.Name)
+                and _is_cached_read(statement.value, file_paths)):
+            i += 1
+            continue
+
+        name = statement.targets[0].id
+        path = statement.value.args[0].value
+        schema = schema_of(path)
+
+        where = None
+        following = body[i + 1] if i + 1 < len(body) else None
+        if (isinstance(following, ast.Assign) and len(following.targets) == 1
+                and isinstance(following.targets[0], ast.Name) and following.targets[0].id == name
+                and isinstance(following.value, ast.Subscript) and isinstance(following.value.value, ast.Name)
+                and following.value.value.id == name):
+            where = _filter_spec(_slice(following.value.slice), name, schema)
+        folded = {statement, following} if where is not None else {statement}
+
+        # Every other reference to the variable must be a recognisable column access
+        skip = {n for s in folded for n in ast.walk(s)}
+        parents = _parents(tree)
+        columns = set()
+        for node in ast.walk(tree):
+            if node in skip or not (isinstance(node, ast.Name) and node.id == name):
+                continue
+            used = None if not isinstance(node.ctx, ast.Load) else _columns_used(node, parents, schema)
+            if used is None:
+                columns = None
+                break
+            columns |= used
+
+        keywords = []
+        if columns:
+            keywords.append(ast.keyword('columns', ast.Constant(tuple(c for c in schema.names if c in columns))))
+        if where is not None:
+            keywords.append(ast.keyword('where', ast.Constant(where)))
+        if keywords:
+            statement.value = ast.Call(
+                func=ast.Attribute(ast.Name('pd', ast.Load()), 'read_cached', ast.Load()),
+                args=[ast.Constant(path)], keywords=keywords,
+            )
+            if where is not None:
+                body.pop(i + 1)
+        i += 1
+
+
+def rewrite_code(code_string, file_dict, schema_of):
+    """Parse, strip plotting, validate and rewrite generated code; returns the transformed ``ast.Module``.
+
+    ``schema_of(path)`` gives the Arrow schema of a cached dataset, used to decide which
+    column accesses and filters can be pushed into the read.
+    """
+
+    tree = ast.parse(code_string)
+    plotted = strip_plotting(tree)
+    validate(tree)
+    tree = _FileAndImportRewriter(file_dict).visit(tree)
+    _ensure_result_df(tree, plotted)
+    _push_down_reads(tree, set(file_dict.values()), schema_of)
+    return ast.fix_missing_locations(tree)
@@ -1,25 +1,459 @@
+import numpy as np
 import pandas as pd
-import PyPDF2
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+import operator
+import fcntl
+import hashlib
 import json
 import os
+import threading
+from utils.pdf_extractor import get_pdf_text
+
+# Columnar copies of uploaded CSVs live here, one uncompressed Arrow IPC file per
+# (path, size, mtime). Every process memory-maps the same file, so the data sits
+# once in the OS page cache however many workers read it
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cache')
+
+# Small in-process mirror so hot datasets are not even re-read from the cache file
+_MEMORY_CACHE = {}
+_MEMORY_CACHE_SIZE = 8
+_cache_lock = threading.Lock()
+
+# With copy-on-write (always on from pandas 3) callers can safely share the cached
+# buffers; older pandas needs a real copy to protect the cache from in-place edits
+_COPY_ON_WRITE = int(pd.__version__.split('.')[0]) >= 3
+
+
+def dataset_fingerprint(file_path):
+
+    stat = os.stat(file_path)
+    key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _cache_path(file_path, fingerprint):
+
+    # Prefix by path so stale versions of the same upload can be found and dropped
+    path_hash = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"{path_hash}-{fingerprint[:16]}.arrow")
+
+
+# Rows per chunk when streaming CSVs; bounds peak memory regardless of file size
+CSV_CHUNK_ROWS = 100_000
+# String columns with at most this many distinct values become pandas categories
+CATEGORY_MAX_DISTINCT = 1000
+# Cached datasets up to this size are stored as one record batch so they map zero-copy
+SINGLE_BATCH_MAX_BYTES = 1 << 30
+
+_INT_TYPES = [np.int8, np.int16, np.int32, np.int64, np.uint64]
+_dtype_plans = {}
+
+
+def _looks_like_datetime(values, sample_size=100):
+
+    sample = values.dropna().head(sample_size)
+    if sample.empty:
+        return False
+    try:
+        pd.to_datetime(sample, format='mixed')
+    except (ValueError, TypeError, OverflowError):
+        return False
+    return True
+
+
+def _smallest_int(lo, hi):
+
+    # Compared as Python ints, which are exact at any size (numpy would round near 2**64)
+    lo, hi = int(lo), int(hi)
+    for int_type in _INT_TYPES:
+        info = np.iinfo(int_type)
+        if info.min <= lo and hi <= info.max:
+            return int_type
+    # Nothing holds the range; the caller keeps the column as it is rather than wrap around
+    return None
+
+
+def _infer_dtype_plan(file_path, chunksize=CSV_CHUNK_ROWS):
+    """Scan a CSV chunk by chunk and pick one compact dtype per column.
+
+    Deciding up front keeps every chunk on the same schema, which is what lets
+    chunks be written to the cache one after another and concatenated cheaply.
+    """
+
+    fingerprint = dataset_fingerprint(file_path)
+    if fingerprint in _dtype_plans:
+        return _dtype_plans[fingerprint]
+
+    stats = {}
+    for chunk in pd.read_csv(file_path, chunksize=chunksize):
+        for col in chunk.columns:
+            values = chunk[col]
+            st = stats.setdefault(col, {
+                'numeric': True, 'integer': True, 'float32': True, 'nulls': False,
+                'min': None, 'max': None, 'distinct': set(), 'datetime': None, 'bool': True, 'count': 0,
+            })
+            st['nulls'] = st['nulls'] or bool(values.isna().any())
+            non_null = values.dropna()
+            st['count'] += len(non_null)
+            st['bool'] = st['bool'] and pd.api.types.is_bool_dtype(values.dtype)
+            # Distinct values are kept (as strings) for every chunk, so a column that only turns
+            # into strings in a later chunk still gets the earlier chunks' values as categories
+            if st['distinct'] is not None:
+                st['distinct'].update(non_null.astype(str).unique())
+                if len(st['distinct']) > CATEGORY_MAX_DISTINCT:
+                    st['distinct'] = None
+            if not non_null.empty and (pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_bool_dtype(values.dtype)):
+                # Numbers or booleans anywhere in the column rule out a datetime plan
+                st['datetime'] = False
+
+            if st['numeric'] and pd.api.types.is_numeric_dtype(values.dtype) and not st['bool']:
+                if non_null.empty:
+                    continue
+                lo, hi = non_null.min(), non_null.max()
+                st['min'] = lo if st['min'] is None else min(st['min'], lo)
+                st['max'] = hi if st['max'] is None else max(st['max'], hi)
+                if not pd.api.types.is_integer_dtype(values.dtype):
+                    as_float = non_null.to_numpy(dtype=np.float64)
+                    st['integer'] = st['integer'] and bool(np.all(np.mod(as_float, 1) == 0))
+                    st['float32'] = st['float32'] and bool(np.all(as_float.astype(np.float32) == as_float))
+                continue
+
+            st['numeric'] = False
+            if st['datetime'] is None:
+                st['datetime'] = _looks_like_datetime(values)
+            if st['datetime'] and not non_null.empty:
+                # The sample only proposes a datetime plan: a value that would not parse (and so
+                # become NaT) anywhere in the file keeps the column as text
+                st['datetime'] = not pd.to_datetime(non_null, format='mixed', errors='coerce').isna().any()
+
+    plan = {}
+    for col, st in stats.items():
+        if st['bool']:
+            plan[col] = ('bool', None)
+        elif st['numeric'] and st['min'] is None:
+            plan[col] = ('float', np.float32)
+        elif st['numeric'] and st['integer'] and _smallest_int(st['min'], st['max']) is not None:
+            plan[col] = ('int', _smallest_int(st['min'], st['max']))
+        elif st['numeric'] and st['integer']:
+            # Integers beyond even uint64 (as read, floats like 1e20) stay float64
+            plan[col] = ('float', np.float64)
+        elif st['numeric']:
+            plan[col] = ('float', np.float32 if st['float32'] else np.float64)
+        elif st['datetime']:
+            plan[col] = ('datetime', None)
+        elif st['distinct'] is not None and len(st['distinct']) <= st['count'] // 2:
+            plan[col] = ('category', sorted(st['distinct']))
+        else:
+            plan[col] = ('string', None)
+        if plan[col][0] == 'int' and st['nulls']:
+            # Nullable integer keeps the narrow width instead of falling back to float64
+            name = pd.api.types.pandas_dtype(plan[col][1]).name
+            plan[col] = ('nullable_int', f"UInt{name[4:]}" if name.startswith('uint') else name.capitalize())
+
+    _dtype_plans[fingerprint] = plan
+    return plan
+
+
+def _apply_dtype_plan(chunk, plan):
+
+    for col, (kind, arg) in plan.items():
+        if col not in chunk.columns:
+            continue
+        values = chunk[col]
+        if kind in ('int', 'nullable_int', 'float'):
+            chunk[col] = values.astype(arg)
+        elif kind == 'datetime':
+            chunk[col] = pd.to_datetime(values, format='mixed', errors='coerce')
+        elif kind == 'category':
+            chunk[col] = pd.Categorical(values.astype(str).where(values.notna()), categories=arg)
+    return chunk
+
+
+def downcast_frame(df, max_categories=CATEGORY_MAX_DISTINCT):
+    """Shrink an in-memory frame: narrowest int/float that fits and categories for low-cardinality strings."""
+
+    df = df.copy()
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_bool_dtype(values.dtype):
+            continue
+        if pd.api.types.is_integer_dtype(values.dtype):
+            df[col] = pd.to_numeric(values, downcast='integer')
+        elif pd.api.types.is_float_dtype(values.dtype):
+            as_float32 = values.astype(np.float32)
+            if np.array_equal(as_float32.to_numpy(dtype=np.float64), values.to_numpy(dtype=np.float64), equal_nan=True):
+                df[col] = as_float32
+        elif pd.api.types.is_object_dtype(values.dtype) or pd.api.types.is_string_dtype(values.dtype):
+            distinct = values.nunique()
+            if distinct <= max_categories and distinct <= len(values) // 2:
+                df[col] = values.astype('category')
+    return df
+
+
+def iter_csv_chunks(file_path, chunksize=CSV_CHUNK_ROWS, columns=None, downcast=True):
+    """Stream a CSV as DataFrame chunks that all share one compact schema."""
+
+    plan = _infer_dtype_plan(file_path, chunksize) if downcast else {}
+    usecols = list(columns) if columns is not None else None
+    for chunk in pd.read_csv(file_path, chunksize=chunksize, usecols=usecols):
+        yield _apply_dtype_plan(chunk, plan)
+
+
+def _convert_csv(file_path, cache_file):
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    # Write to a temp name first so readers never see a half-written file
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    writer = None
+    schema = None
+    try:
+        for chunk in iter_csv_chunks(file_path):
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                # Left uncompressed so readers can map columns straight from the file
+                writer = pa.ipc.new_file(tmp_file, schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        # Header-only CSV: nothing streamed, fall back to a one-shot write
+        feather.write_feather(pd.read_csv(file_path), tmp_file, compression='uncompressed')
+    elif os.path.getsize(tmp_file) <= SINGLE_BATCH_MAX_BYTES:
+        # pandas can only view a column in place if it is one contiguous buffer,
+        # so rewrite datasets that fit comfortably in memory as a single batch
+        with pa.memory_map(tmp_file, 'r') as source:
+            table = pa.ipc.open_file(source).read_all().combine_chunks()
+        with pa.ipc.new_file(f"{tmp_file}.single", table.schema) as single_writer:
+            single_writer.write_table(table)
+        del table
+        os.replace(f"{tmp_file}.single", tmp_file)
+    os.replace(tmp_file, cache_file)
+
+    prefix = os.path.basename(cache_file).split('-')[0] + '-'
+    for name in os.listdir(CACHE_DIR):
+        if name.startswith(prefix) and name != os.path.basename(cache_file):
+            try:
+                os.remove(os.path.join(CACHE_DIR, name))
+            except OSError:
+                pass
+
+
+def _load_cached(file_path):
+
+    fingerprint = dataset_fingerprint(file_path)
+
+    with _cache_lock:
+        df = _MEMORY_CACHE.get(fingerprint)
+    if df is None:
+        # split_blocks keeps numeric columns as views over the mapped file
+        df = open_dataset_table(file_path).to_pandas(split_blocks=True)
+
+        with _cache_lock:
+            _MEMORY_CACHE[fingerprint] = df
+            while len(_MEMORY_CACHE) > _MEMORY_CACHE_SIZE:
+                _MEMORY_CACHE.pop(next(iter(_MEMORY_CACHE)))
+    return df
+
+
+def dataset_cache_file(file_path):
+
+    # Make sure the columnar copy exists and return its path
+    cache_file = _cache_path(file_path, dataset_fingerprint(file_path))
+    if os.path.exists(cache_file):
+        return cache_file
+
+    # Several worker processes may ask for a fresh upload at once; only one converts
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(f"{cache_file}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(cache_file):
+                _convert_csv(file_path, cache_file)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    try:
+        os.remove(f"{cache_file}.lock")
+    except OSError:
+        pass
+    return cache_file
+
+
+def open_dataset_table(file_path, columns=None):
+    """Arrow table memory-mapped from the dataset cache, without copying the data."""
+
+    source = pa.memory_map(dataset_cache_file(file_path), 'r')
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(list(columns))
+    return table
+
+
+def iter_dataset_chunks(file_path, columns=None):
+
+    # Record batches of the cached file, so callers never hold the whole table
+    with pa.memory_map(dataset_cache_file(file_path), 'r') as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = batch.select(list(columns))
+            # Slicing a mapped batch is free, so large batches still come out in bounded chunks
+            for offset in range(0, batch.num_rows, CSV_CHUNK_ROWS):
+                yield batch.slice(offset, CSV_CHUNK_ROWS).to_pandas(split_blocks=True)
+
+
+def chunked_value_counts(file_path, column):
+    """Value counts of one column, combined across chunks of the cached dataset."""
+
+    total = None
+    for chunk in iter_dataset_chunks(file_path, columns=[column]):
+        counts = chunk[column].value_counts()
+        total = counts if total is None else total.add(counts, fill_value=0)
+    if total is None:
+        return pd.Series(dtype='int64', name='count')
+    return total.astype('int64').sort_values(ascending=False)
+
+
+def chunked_groupby_agg(file_path, by, column, agg='sum'):
+    """Group-by aggregate computed chunk by chunk; supports sum, count, min, max and mean."""
+
+    by = [by] if isinstance(by, str) else list(by)
+    # mean is rebuilt from partial sums and counts, the rest combine with themselves
+    partial_aggs = ['sum', 'count'] if agg == 'mean' else [agg]
+    combine = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+    if any(a not in combine for a in partial_aggs):
+        raise ValueError(f"Unsupported aggregation: {agg}")
+
+    partials = []
+    for chunk in iter_dataset_chunks(file_path, columns=by + [column]):
+        partials.append(chunk.groupby(by, observed=True)[column].agg(partial_aggs))
+    if not partials:
+        return pd.Series(dtype='float64', name=column)
+
+    combined = pd.concat(partials).groupby(level=list(range(len(by))), observed=True).agg(
+        {a: combine[a] for a in partial_aggs}
+    )
+    if agg == 'mean':
+        result = combined['sum'] / combined['count']
+    else:
+        result = combined[agg]
+    return result.rename(column)
+
+
+def frame_view(df, columns=None):
+    """Copy of a shared frame (optionally just ``columns``) that the caller may modify."""
+
+    if columns is not None:
+        df = df[list(columns)]
+    # In-place edits by callers must never leak into the shared cache
+    return df.copy(deep=not _COPY_ON_WRITE)
+
+
+def load_dataset(file_path, columns=None):
+
+    return frame_view(_load_cached(file_path), columns)
+
+
+# Row filter specs are nested tuples: ('cmp', column, op, value), ('isin', column, values),
+# ('and', a, b), ('or', a, b) and ('not', a)
+FILTER_OPS = {
+    '==': (operator.eq, pc.equal),
+    '!=': (operator.ne, pc.not_equal),
+    '<': (operator.lt, pc.less),
+    '<=': (operator.le, pc.less_equal),
+    '>': (operator.gt, pc.greater),
+    '>=': (operator.ge, pc.greater_equal),
+}
+
+
+def filter_columns(where):
+
+    if where[0] in ('cmp', 'isin'):
+        return {where[1]}
+    return set().union(*(filter_columns(part) for part in where[1:]))
+
+
+def frame_mask(df, where):
+
+    kind = where[0]
+    if kind == 'cmp':
+        return FILTER_OPS[where[2]][0](df[where[1]], where[3])
+    if kind == 'isin':
+        return df[where[1]].isin(where[2])
+    if kind == 'not':
+        return ~frame_mask(df, where[1])
+    left, right = frame_mask(df, where[1]), frame_mask(df, where[2])
+    return left & right if kind == 'and' else left | right
+
+
+def _table_mask(table, where):
+
+    kind = where[0]
+    if kind in ('cmp', 'isin'):
+        column = table.column(where[1])
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(column.type.value_type)
+        if kind == 'isin':
+            mask = pc.is_in(column, value_set=pa.array(where[2], type=column.type))
+        else:
+            mask = FILTER_OPS[where[2]][1](column, where[3])
+        # Missing values compare like NaN does in pandas: unequal to everything
+        return pc.fill_null(mask, kind == 'cmp' and where[2] == '!=')
+    if kind == 'not':
+        return pc.invert(_table_mask(table, where[1]))
+    left, right = _table_mask(table, where[1]), _table_mask(table, where[2])
+    return pc.and_(left, right) if kind == 'and' else pc.or_(left, right)
+
+
+def read_dataset(file_path, columns=None, where=None):
+    """Rows of a dataset matching the filter spec ``where``, restricted to ``columns``.
+
+    A dataset that is hot in memory is filtered there; otherwise only the needed
+    columns are read from the columnar cache and filtered before conversion to pandas.
+    Row labels are the same as in the full frame.
+    """
+
+    with _cache_lock:
+        df = _MEMORY_CACHE.get(dataset_fingerprint(file_path))
+    if df is not None:
+        if where is not None:
+            df = df[frame_mask(df, where)]
+        return frame_view(df, columns)
+
+    needed = columns
+    if columns is not None and where is not None:
+        needed = list(columns) + sorted(filter_columns(where) - set(columns))
+    table = open_dataset_table(file_path, needed)
+    if where is None:
+        return table.to_pandas(split_blocks=True)
+    try:
+        indices = pc.indices_nonzero(_table_mask(table, where))
+    except (pa.ArrowException, TypeError):
+        # e.g. a constant outside the column's type range: let pandas decide
+        df = table.to_pandas(split_blocks=True)
+        return frame_view(df[frame_mask(df, where)], columns)
+    if columns is not None:
+        table = table.select(list(columns))
+    df = table.take(indices).to_pandas(split_blocks=True)
+    df.index = pd.Index(indices.to_numpy())
+    return df
+
 
 def get_file_content(file_path, file_type, preview=False):
     
     try:
         if file_type == 'csv':
-            df = pd.read_csv(file_path)
             if preview:
-                return df.head(5).to_string()
-            return df
+                return _load_cached(file_path).head(5).to_string()
+            return load_dataset(file_path)
         
         elif file_type == 'pdf':
-            content = ""
-            with open(file_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    content += page.extract_text() + "\n"
-            return content
+            return get_pdf_text(file_path)
         
         elif file_type == 'txt':
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -35,7 +469,7 @@ def get_file_content(file_path, file_type, preview=False):
 def process_csv_data(file_path):
     
     try:
-        return pd.read_csv(file_path)
+        return load_dataset(file_path)
     except Exception as e:
         print(f"Error processing CSV: {str(e)}")
         return None
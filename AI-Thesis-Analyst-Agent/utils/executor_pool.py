@@ -0,0 +1,284 @@
+import atexit
+import contextlib
+import io
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict, namedtuple
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import resource
+except ImportError:  # Not available on Windows: workers then run without a memory cap
+    resource = None
+
+POOL_SIZE = int(os.environ.get('AI_ANALYST_EXEC_WORKERS', 0)) or max(2, min(4, os.cpu_count() or 1))
+# Wall-clock seconds a job may run before its worker is killed
+EXEC_TIMEOUT = float(os.environ.get('AI_ANALYST_EXEC_TIMEOUT', 30))
+# Heap (not mapped dataset files) a worker may allocate
+MEMORY_LIMIT = int(os.environ.get('AI_ANALYST_EXEC_MEMORY_MB', 2048)) * 1024 * 1024
+# Jobs a worker runs before it is replaced by a fresh one; 0 keeps workers forever
+MAX_JOBS_PER_WORKER = int(os.environ.get('AI_ANALYST_EXEC_MAX_JOBS', 200))
+# How long a caller waits for a free worker
+SLOT_WAIT = 30
+# Datasets a newly started worker loads before taking jobs (the most recently used ones)
+HOT_DATASETS = 8
+
+ExecutionResult = namedtuple('ExecutionResult', ['result_df', 'stdout', 'seconds'])
+
+
+class ExecutionError(Exception):
+
+    def __init__(self, message, stdout=''):
+        super().__init__(message)
+        self.stdout = stdout
+
+
+class ExecutionTimeout(ExecutionError):
+    pass
+
+
+class ExecutionMemoryError(ExecutionError):
+    pass
+
+
+class ExecutorBusyError(ExecutionError):
+    pass
+
+
+def encode_result(result_df, compression=None):
+    """``(kind, bytes)`` for a result: an Arrow IPC stream for frames, pickle for anything else.
+
+    Arrow turns column labels into strings, so frames with any other label (e.g. the integer
+    columns of a pivot or ``unstack()``) are pickled to come back exactly as they went in.
+    """
+
+    if isinstance(result_df, pd.DataFrame) and all(isinstance(col, str) for col in result_df.columns):
+        try:
+            table = pa.Table.from_pandas(result_df)
+            sink = pa.BufferOutputStream()
+            options = pa.ipc.IpcWriteOptions(compression=compression)
+            with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+            return 'arrow', sink.getvalue().to_pybytes()
+        except (pa.ArrowException, TypeError, ValueError):
+            pass
+    return 'pickle', pickle.dumps(result_df, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_result(kind, payload):
+
+    if kind == 'arrow':
+        return pa.ipc.open_stream(payload).read_all().to_pandas()
+    return pickle.loads(payload)
+
+
+def _limit_memory(memory_limit):
+
+    if resource is None or not memory_limit:
+        return
+    # RLIMIT_DATA covers heap and anonymous mappings but not the memory-mapped dataset
+    # cache, so large uploads stay shareable while runaway intermediates hit the cap
+    limit = getattr(resource, 'RLIMIT_DATA', resource.RLIMIT_AS)
+    soft, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY:
+        memory_limit = min(memory_limit, hard)
+    resource.setrlimit(limit, (memory_limit, hard))
+
+
+def _worker_main(conn, memory_limit, warm_paths):
+
+    # Everything is imported (and the hot datasets loaded) before the memory cap applies
+    from utils.code_executor import run_code
+    from utils.data_processor import load_dataset
+
+    for path in warm_paths:
+        try:
+            load_dataset(path)
+        except Exception:
+            pass
+    _limit_memory(memory_limit)
+    conn.send(('ready', os.getpid()))
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if job is None:
+            return
+
+        code_string, csv_files, use_cache = job
+        stdout = io.StringIO()
+        start = time.perf_counter()
+        try:
+            # Each worker runs one job at a time, so redirecting the process streams is safe
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stdout):
+                result_df = run_code(code_string, csv_files, stdout=stdout, use_cache=use_cache)
+            kind, payload = encode_result(result_df)
+            message = ('ok', kind, payload, stdout.getvalue(), time.perf_counter() - start)
+        except MemoryError:
+            message = ('memory', 'Out of memory', stdout.getvalue(), time.perf_counter() - start)
+        except Exception as e:
+            stdout.write(traceback.format_exc())
+            message = ('error', f"{type(e).__name__}: {e}", stdout.getvalue(), time.perf_counter() - start)
+        try:
+            conn.send(message)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            conn.send(('error', f"Result could not be transferred: {e}", stdout.getvalue(), 0.0))
+
+
+class _Worker:
+
+    def __init__(self, context, memory_limit, warm_paths):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, memory_limit, warm_paths), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+        self.ready = False
+
+    def wait_ready(self, timeout):
+
+        if self.ready:
+            return
+        if not self.conn.poll(timeout):
+            raise ExecutionError("Executor worker did not start in time")
+        self.conn.recv()
+        self.ready = True
+
+    def stop(self, kill=False):
+
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class ExecutorPool:
+    """Pre-started worker processes that run generated pandas code in isolation.
+
+    Every job gets a wall-clock timeout and runs under a memory cap; a worker that
+    times out, runs out of memory or crashes is replaced, and healthy workers are
+    recycled after ``max_jobs`` jobs.
+    """
+
+    def __init__(self, size=POOL_SIZE, timeout=EXEC_TIMEOUT, memory_limit=MEMORY_LIMIT,
+                 max_jobs=MAX_JOBS_PER_WORKER):
+        self.size = size
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_jobs = max_jobs
+        # forkserver forks workers from a clean single-threaded server with pandas preloaded,
+        # never from the multi-threaded Flask process
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context('forkserver')
+            self._context.set_forkserver_preload(['pandas', 'pyarrow', 'utils.code_executor'])
+        else:
+            self._context = multiprocessing.get_context('spawn')
+        self._hot = OrderedDict()
+        self._hot_lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+
+        with self._hot_lock:
+            warm_paths = list(self._hot)
+        return _Worker(self._context, self.memory_limit, warm_paths)
+
+    def _remember(self, csv_files):
+
+        with self._hot_lock:
+            for path in csv_files:
+                self._hot[path] = True
+                self._hot.move_to_end(path)
+            while len(self._hot) > HOT_DATASETS:
+                self._hot.popitem(last=False)
+
+    def _release(self, worker, healthy):
+
+        if self._closed:
+            worker.stop(kill=not healthy)
+            return
+        if healthy and (not self.max_jobs or worker.jobs < self.max_jobs):
+            self._idle.put(worker)
+            return
+        # Start the replacement first so the pool never shrinks, then retire the old worker
+        self._idle.put(self._spawn())
+        threading.Thread(target=worker.stop, kwargs={'kill': not healthy}, daemon=True).start()
+
+    def execute(self, code_string, csv_files, timeout=None, use_cache=True):
+        """Run ``code_string`` in a worker and return an ``ExecutionResult``.
+
+        ``use_cache=False`` makes the worker compile the code afresh.
+        """
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            worker = self._idle.get(timeout=SLOT_WAIT)
+        except queue.Empty:
+            raise ExecutorBusyError("All executor workers are busy")
+
+        healthy = False
+        try:
+            worker.wait_ready(SLOT_WAIT)
+            worker.jobs += 1
+            worker.conn.send((code_string, list(csv_files), use_cache))
+            if not worker.conn.poll(timeout):
+                raise ExecutionTimeout(f"Code ran for more than {timeout:g}s")
+            try:
+                message = worker.conn.recv()
+            except EOFError:
+                worker.process.join(timeout=1)
+                raise ExecutionError(f"Executor worker died (exit code {worker.process.exitcode})")
+            # A worker that hit the memory cap may be left fragmented; replace it
+            healthy = message[0] != 'memory'
+        finally:
+            self._release(worker, healthy)
+
+        self._remember(csv_files)
+        status = message[0]
+        if status == 'ok':
+            _, kind, payload, stdout, seconds = message
+            return ExecutionResult(decode_result(kind, payload), stdout, seconds)
+        if status == 'memory':
+            raise ExecutionMemoryError(message[1], message[2])
+        raise ExecutionError(message[1], message[2])
+
+    def close(self):
+
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExecutorPool()
+            atexit.register(_pool.close)
+        return _pool
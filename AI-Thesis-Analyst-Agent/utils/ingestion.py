@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from utils.catalog import catalog
+from utils.data_processor import load_dataset
+from utils.pdf_extractor import get_pdf_pages
+from utils.profiler import get_profile
+from utils.retrieval import index_document
+
+ALLOWED_EXTENSIONS = {'.csv', '.pdf', '.txt', '.json'}
+TEXT_EXTENSIONS = ('.pdf', '.txt')
+
+INGEST_WORKERS = 2
+# Jobs waiting or running at once; uploads beyond this are refused rather than queued forever
+MAX_PENDING_JOBS = 32
+# Finished jobs kept around so clients can still poll their status
+MAX_FINISHED_JOBS = 500
+
+STAGES = ('validate', 'convert', 'profile', 'index')
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix='ingest')
+_pending = threading.BoundedSemaphore(MAX_PENDING_JOBS)
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class IngestionError(Exception):
+    pass
+
+
+class IngestionQueueFull(IngestionError):
+    pass
+
+
+def _update(job_id, **fields):
+
+    with _jobs_lock:
+        _jobs[job_id].update(fields)
+
+
+def validate_upload(file_path, filename=None):
+    """Raise IngestionError for files that should not be accepted; run before the file is catalogued.
+
+    ``filename`` is the name the file will be stored under, when ``file_path`` is a temporary copy.
+    """
+
+    ext = os.path.splitext(filename or file_path)[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise IngestionError(f"Unsupported file type: {ext or 'none'}")
+    if os.path.getsize(file_path) == 0:
+        raise IngestionError("File is empty")
+    return ext
+
+
+def _convert(file_path, ext):
+
+    if ext == '.csv':
+        load_dataset(file_path)
+    elif ext == '.pdf':
+        get_pdf_pages(file_path)
+
+
+def _profile(file_path, ext):
+
+    profile = {'size': os.path.getsize(file_path)}
+    if ext == '.csv':
+        dataset_profile = get_profile(file_path)
+        profile['rows'] = dataset_profile['rows']
+        profile['columns'] = {col: info['dtype'] for col, info in dataset_profile['columns'].items()}
+    elif ext == '.pdf':
+        profile['pages'] = len(get_pdf_pages(file_path))
+    return profile
+
+
+def _index(file_path, ext):
+
+    if ext not in TEXT_EXTENSIONS:
+        return
+    # Only the new document is tokenized; searches merge it with the folder's stored counts
+    index_document(file_path)
+
+
+def _run_job(job_id, file_path):
+
+    try:
+        _update(job_id, status='running', started_at=time.time())
+
+        _update(job_id, stage='validate', progress=0.0)
+        ext = validate_upload(file_path)
+
+        _update(job_id, stage='convert', progress=0.25)
+        _convert(file_path, ext)
+
+        _update(job_id, stage='profile', progress=0.5)
+        profile = _profile(file_path, ext)
+        catalog.upsert(file_path, rows=profile.get('rows'), schema=profile.get('columns'))
+
+        _update(job_id, stage='index', progress=0.75)
+        _index(file_path, ext)
+
+        _update(job_id, status='done', stage=None, progress=1.0, profile=profile, finished_at=time.time())
+    except Exception as e:
+        _update(job_id, status='failed', error=str(e), finished_at=time.time())
+    finally:
+        _pending.release()
+        _prune_finished()
+
+
+def _prune_finished():
+
+    with _jobs_lock:
+        finished = [job for job in _jobs.values() if job['status'] in ('done', 'failed')]
+        if len(finished) <= MAX_FINISHED_JOBS:
+            return
+        finished.sort(key=lambda job: job['finished_at'])
+        for job in finished[:len(finished) - MAX_FINISHED_JOBS]:
+            del _jobs[job['id']]
+
+
+def submit_ingestion(file_path):
+
+    if not _pending.acquire(blocking=False):
+        raise IngestionQueueFull("Too many uploads are being processed, try again shortly")
+
+    job_id = uuid.uuid4().hex
+    with _jobs_lock:
+        _jobs[job_id] = {
+            'id': job_id,
+            'file': os.path.basename(file_path),
+            'status': 'queued',
+            'stage': None,
+            'progress': 0.0,
+            'error': None,
+            'submitted_at': time.time(),
+        }
+    _executor.submit(_run_job, job_id, file_path)
+    return job_id
+
+
+def get_job(job_id):
+
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job is not None else None
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from utils.data_processor import CACHE_DIR, dataset_fingerprint
+
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, 'llm_responses.sqlite')
+
+MEMORY_ENTRIES = 256
+DISK_MAX_BYTES = 256 * 1024 * 1024
+TTL_SECONDS = 24 * 60 * 60
+EVICT_BATCH = 64
+
+
+def cache_key(model, response_type, prompt, datasets=()):
+    """Key on the model, response type, prompt and the current version of every referenced dataset."""
+
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    fingerprints = sorted(dataset_fingerprint(path) for path in datasets)
+    raw = '|'.join([model, response_type, prompt_hash] + fingerprints)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier LLM response cache: in-process LRU in front of a size-bounded SQLite store.
+
+    The memory tier is an OrderedDict used as an LRU (move_to_end on hit, popitem from the
+    front on overflow). On disk, triggers keep the total payload size in a one-row table and
+    eviction walks the ``accessed_at`` index oldest-first, so a put never scans the store.
+    """
+
+    def __init__(self, db_path=LLM_CACHE_PATH, memory_entries=MEMORY_ENTRIES,
+                 disk_max_bytes=DISK_MAX_BYTES, ttl=TTL_SECONDS):
+        self.db_path = db_path
+        self.memory_entries = memory_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses_usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO responses_usage SELECT 0, COALESCE(SUM(size), 0) FROM responses")
+            conn.executescript(
+                """
+                CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses BEGIN
+                    UPDATE responses_usage SET bytes = bytes + NEW.size;
+                END;
+                CREATE TRIGGER IF NOT EXISTS responses_update AFTER UPDATE OF size ON responses BEGIN
+                    UPDATE responses_usage SET bytes = bytes + NEW.size - OLD.size;
+                END;
+                CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses BEGIN
+                    UPDATE responses_usage SET bytes = bytes - OLD.size;
+                END;
+                """
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _remember(self, key, value, created_at):
+        # Caller holds the lock
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] >= self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+
+        with self._lock:
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._remember(key, row[0], row[1])
+        return row[0]
+
+    def put(self, key, value):
+
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+
+        size = len(value.encode('utf-8'))
+        with self._connect() as conn:
+            # An upsert rather than INSERT OR REPLACE: REPLACE's implicit delete skips the delete trigger
+            conn.execute(
+                "INSERT INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "created_at = excluded.created_at, accessed_at = excluded.accessed_at",
+                (key, value, size, now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+
+        conn.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl,))
+        total = conn.execute("SELECT bytes FROM responses_usage").fetchone()[0]
+        # Drop least recently used entries, a few at a time off the index, until back under budget
+        while total > self.disk_max_bytes:
+            rows = conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT ?", (EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                total -= size
+                if total <= self.disk_max_bytes:
+                    break
+            conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def clear(self):
+
+        with self._lock:
+            self._memory.clear()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,177 @@
+import json
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) in seconds; connect is short so dead hosts fail fast
+DEFAULT_TIMEOUT = (3.05, 60)
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+# Concurrent requests allowed per provider, and how long a caller waits for a slot
+MAX_IN_FLIGHT = 8
+SLOT_WAIT = 30
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMTimeoutError(LLMError):
+    pass
+
+
+class LLMBusyError(LLMError):
+    pass
+
+
+class LLMHTTPError(LLMError):
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+# A body shaped unlike {"choices": [{"text": ...}]} raises one of these while being read
+MALFORMED_RESPONSE_ERRORS = (ValueError, KeyError, IndexError, TypeError, AttributeError)
+
+
+def _completion_text(body):
+
+    text = body.get('choices', [{}])[0].get('text', '')
+    if text is None:
+        return ''
+    if not isinstance(text, str):
+        raise TypeError(f"completion text is {type(text).__name__}")
+    return text
+
+
+class LLMClient:
+    """Completion client for one provider with its own pooled session and in-flight cap."""
+
+    def __init__(self, name, api_url, api_key, timeout=DEFAULT_TIMEOUT, max_retries=MAX_RETRIES,
+                 max_in_flight=MAX_IN_FLIGHT):
+        self.name = name
+        self.api_url = api_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        # Keep-alive connections are reused across requests, sized to the in-flight cap
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Authorization': f"Bearer {api_key}",
+            'Content-Type': 'application/json',
+        })
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, BACKOFF_CAP)
+        # Full jitter keeps retries from several workers from landing together
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    def _post(self, payload, stream=False):
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff(attempt - 1, getattr(last_error, 'retry_after', None)))
+            try:
+                response = self.session.post(self.api_url, json=payload, timeout=self.timeout, stream=stream)
+            except requests.exceptions.ConnectTimeout:
+                last_error = LLMTimeoutError(f"{self.name}: connect timed out")
+                continue
+            except requests.exceptions.ReadTimeout as e:
+                # The request may already be running upstream; retrying would only double the wait
+                raise LLMTimeoutError(f"{self.name}: no response within {self.timeout[1]}s") from e
+            except requests.exceptions.ConnectionError as e:
+                last_error = LLMError(f"{self.name}: connection failed: {e}")
+                continue
+            except requests.exceptions.RequestException as e:
+                # Bad URL, invalid headers and the like: retrying cannot help
+                raise LLMError(f"{self.name}: request failed: {e}") from e
+
+            if response.status_code in RETRYABLE_STATUS:
+                last_error = LLMHTTPError(f"{self.name}: HTTP {response.status_code}", response.status_code)
+                retry_after = response.headers.get('Retry-After')
+                if retry_after and retry_after.isdigit():
+                    last_error.retry_after = float(retry_after)
+                response.close()
+                continue
+            if response.status_code >= 400:
+                response.close()
+                raise LLMHTTPError(f"{self.name}: HTTP {response.status_code}", response.status_code)
+            return response
+
+        raise last_error
+
+    def complete(self, prompt, max_tokens=1000, temperature=0.7):
+
+        if not self._slots.acquire(timeout=SLOT_WAIT):
+            raise LLMBusyError(f"{self.name}: too many requests in flight")
+        try:
+            response = self._post({'prompt': prompt, 'max_tokens': max_tokens, 'temperature': temperature})
+            try:
+                result = _completion_text(response.json())
+            except MALFORMED_RESPONSE_ERRORS as e:
+                # An LLMError, so the router fails over instead of surfacing a 500
+                raise LLMError(f"{self.name}: malformed response: {e}") from e
+            return result.strip()
+        finally:
+            self._slots.release()
+
+    def stream(self, prompt, max_tokens=1000, temperature=0.7):
+        """Yield completion text as the provider streams it (server-sent ``data:`` lines)."""
+
+        if not self._slots.acquire(timeout=SLOT_WAIT):
+            raise LLMBusyError(f"{self.name}: too many requests in flight")
+        try:
+            # Retries only happen before the first byte; a stream cut mid-way is an error
+            response = self._post(
+                {'prompt': prompt, 'max_tokens': max_tokens, 'temperature': temperature, 'stream': True},
+                stream=True,
+            )
+            with response:
+                # Event streams are UTF-8 by definition; requests would otherwise guess Latin-1
+                # for text/* and hand back bytes when no charset is given
+                response.encoding = 'utf-8'
+                try:
+                    # chunk_size=None hands over each chunk as soon as it arrives
+                    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                        if not line or not line.startswith('data:'):
+                            continue
+                        data = line[len('data:'):].strip()
+                        if data == '[DONE]':
+                            break
+                        try:
+                            text = _completion_text(json.loads(data))
+                        except MALFORMED_RESPONSE_ERRORS as e:
+                            raise LLMError(f"{self.name}: malformed stream event: {e}") from e
+                        if text:
+                            yield text
+                except requests.exceptions.ReadTimeout as e:
+                    raise LLMTimeoutError(f"{self.name}: stream stalled for {self.timeout[1]}s") from e
+                except requests.exceptions.RequestException as e:
+                    raise LLMError(f"{self.name}: stream interrupted: {e}") from e
+        finally:
+            self._slots.release()
+
+
+def get_client(name, config):
+
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None or client.api_url != config['api_url'] or client.api_key != config['api_key']:
+            client = LLMClient(name, config['api_url'], config['api_key'])
+            _clients[name] = client
+        return client
@@ -0,0 +1,162 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from utils.llm_client import LLMError
+
+WINDOW = 100
+# Below this many samples a provider's p95 is too noisy to hedge on
+MIN_HEDGE_SAMPLES = 20
+# Consecutive failures before a provider is ejected, and for how long
+EJECT_AFTER = 5
+COOLDOWN_SECONDS = 30
+# A requested provider keeps going first only while its score is within this factor of the best
+PREFERENCE_SLACK = 1.5
+
+
+class ProviderStats:
+
+    def __init__(self):
+        self.latencies = deque(maxlen=WINDOW)
+        self.outcomes = deque(maxlen=WINDOW)
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.in_flight = 0
+
+    def p95(self):
+        if len(self.latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        return float(np.percentile(self.latencies, 95))
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def score(self):
+        # Lower is better: typical latency, inflated by recent errors and by calls already
+        # waiting on this provider, so concurrent requests spread out
+        median = float(np.median(self.latencies)) if self.latencies else 1.0
+        return median * (1 + 5 * self.error_rate()) * (1 + self.in_flight)
+
+    def snapshot(self, now):
+        return {
+            'samples': len(self.latencies),
+            'p50': float(np.median(self.latencies)) if self.latencies else None,
+            'p95': self.p95(),
+            'error_rate': self.error_rate(),
+            'in_flight': self.in_flight,
+            'ejected': self.ejected_until > now,
+        }
+
+
+class ModelRouter:
+    """Picks the healthiest provider per request, hedges slow calls and ejects failing providers."""
+
+    def __init__(self, providers, max_workers=32):
+        self._stats = {name: ProviderStats() for name in providers}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='router')
+
+    def record(self, name, latency, ok):
+
+        now = time.time()
+        with self._lock:
+            stats = self._stats[name]
+            stats.outcomes.append(ok)
+            if ok:
+                stats.latencies.append(latency)
+                stats.consecutive_failures = 0
+            else:
+                stats.consecutive_failures += 1
+                if stats.consecutive_failures >= EJECT_AFTER:
+                    stats.ejected_until = now + COOLDOWN_SECONDS
+                    stats.consecutive_failures = 0
+
+    def order(self, preferred=None):
+        """Providers to try, best first. Ejected ones go last rather than being dropped.
+
+        ``preferred`` leads while its score is within PREFERENCE_SLACK of the best one;
+        once it is slower, erroring or busier than that, the best provider goes first.
+        """
+
+        now = time.time()
+        with self._lock:
+            healthy = [n for n, s in self._stats.items() if s.ejected_until <= now]
+            ejected = [n for n, s in self._stats.items() if s.ejected_until > now]
+            # Shuffled first so providers with equal scores (e.g. no samples yet) share the load
+            random.shuffle(healthy)
+            scores = {n: self._stats[n].score() for n in healthy}
+            healthy.sort(key=scores.get)
+            ejected.sort(key=lambda n: self._stats[n].ejected_until)
+        if preferred in healthy and scores[preferred] <= PREFERENCE_SLACK * scores[healthy[0]]:
+            healthy.remove(preferred)
+            healthy.insert(0, preferred)
+        return healthy + ejected
+
+    def started(self, name):
+
+        with self._lock:
+            self._stats[name].in_flight += 1
+
+    def finished(self, name):
+
+        with self._lock:
+            self._stats[name].in_flight -= 1
+
+    def hedge_delay(self, name):
+
+        with self._lock:
+            return self._stats[name].p95()
+
+    def _timed(self, fn, name):
+
+        start = time.monotonic()
+        self.started(name)
+        try:
+            result = fn(name)
+        except LLMError:
+            self.record(name, time.monotonic() - start, False)
+            raise
+        finally:
+            self.finished(name)
+        self.record(name, time.monotonic() - start, True)
+        return name, result
+
+    def call(self, fn, preferred=None):
+        """Run ``fn(provider_name)`` on the best provider.
+
+        If it is still running after that provider's p95 latency, the same call is
+        fired at the next provider and whichever succeeds first wins. Failures fall
+        through to the remaining providers in order.
+        """
+
+        candidates = self.order(preferred)
+        pending = set()
+        last_error = None
+
+        while candidates or pending:
+            if candidates:
+                name = candidates.pop(0)
+                pending.add(self._executor.submit(self._timed, fn, name))
+                delay = self.hedge_delay(name) if candidates else None
+            else:
+                delay = None
+
+            done, pending = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except LLMError as e:
+                    last_error = e
+            # Either nothing finished within p95 (hedge) or everything in flight failed (fall back)
+
+        raise last_error if last_error is not None else LLMError("No providers configured")
+
+    def snapshot(self):
+
+        now = time.time()
+        with self._lock:
+            return {name: stats.snapshot(now) for name, stats in self._stats.items()}
@@ -0,0 +1,96 @@
+import PyPDF2
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Per-page text of every PDF seen so far, one JSON file per content hash
+PDF_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cache', 'pdf')
+
+# Documents shorter than this are extracted inline; pool start-up would cost more
+PARALLEL_MIN_PAGES = 16
+MAX_WORKERS = os.cpu_count() or 2
+
+_pages_by_hash = {}
+_hash_by_stat = {}
+_store_lock = threading.Lock()
+
+
+def content_hash(file_path):
+
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def document_hash(file_path):
+
+    # Hashing hundreds of pages of PDF on every call defeats the point, so remember
+    # the hash for as long as the file's size and mtime are unchanged
+    stat = os.stat(file_path)
+    stat_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    with _store_lock:
+        digest = _hash_by_stat.get(stat_key)
+    if digest is None:
+        digest = content_hash(file_path)
+        with _store_lock:
+            _hash_by_stat[stat_key] = digest
+    return digest
+
+
+def _extract_page_range(file_path, start, stop):
+
+    with open(file_path, 'rb') as f:
+        pdf_reader = PyPDF2.PdfReader(f)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _extract_pages(file_path):
+
+    with open(file_path, 'rb') as f:
+        num_pages = len(PyPDF2.PdfReader(f).pages)
+
+    if num_pages < PARALLEL_MIN_PAGES or MAX_WORKERS < 2:
+        return _extract_page_range(file_path, 0, num_pages)
+
+    step = -(-num_pages // MAX_WORKERS)
+    ranges = [(start, min(start + step, num_pages)) for start in range(0, num_pages, step)]
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [pool.submit(_extract_page_range, file_path, start, stop) for start, stop in ranges]
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+    return pages
+
+
+def get_pdf_pages(file_path):
+
+    digest = document_hash(file_path)
+    with _store_lock:
+        pages = _pages_by_hash.get(digest)
+    if pages is not None:
+        return pages
+
+    store_file = os.path.join(PDF_CACHE_DIR, f"{digest}.json")
+    if os.path.exists(store_file):
+        with open(store_file, 'r', encoding='utf-8') as f:
+            pages = json.load(f)
+    else:
+        pages = _extract_pages(file_path)
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        tmp_file = f"{store_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(pages, f)
+        os.replace(tmp_file, store_file)
+
+    with _store_lock:
+        _pages_by_hash[digest] = pages
+    return pages
+
+
+def get_pdf_text(file_path):
+
+    return "\n".join(get_pdf_pages(file_path))
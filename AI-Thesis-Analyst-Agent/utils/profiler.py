@@ -0,0 +1,273 @@
+import numpy as np
+import pandas as pd
+import json
+import os
+import re
+import threading
+from utils.data_processor import CACHE_DIR, dataset_fingerprint, iter_dataset_chunks
+
+PROFILE_DIR = os.path.join(CACHE_DIR, 'profiles')
+
+# Columns with at most this many distinct values keep exact value counts
+EXACT_COUNTS_LIMIT = 1000
+HISTOGRAM_BINS = 20
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+class HyperLogLog:
+    """Approximate distinct counter (2**p one-byte registers, ~1.6% error at p=12)."""
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, values):
+        hashes = pd.util.hash_array(np.asarray(values))
+        if hashes.size == 0:
+            return
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # Position of the leftmost 1-bit in the remaining 64-p bits
+        bit_length = np.zeros(rest.shape, dtype=np.int64)
+        nonzero = rest > 0
+        bit_length[nonzero] = np.floor(np.log2(rest[nonzero].astype(np.float64))).astype(np.int64) + 1
+        rank = (64 - self.p) - bit_length + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def count(self):
+        m = float(self.registers.size)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+class TDigest:
+    """Merging t-digest for streaming quantiles, compressed with the arcsine scale function."""
+
+    def __init__(self, delta=100):
+        self.delta = delta
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        means = np.concatenate([self.means, values])
+        weights = np.concatenate([self.weights, np.ones(values.size)])
+        order = np.argsort(means, kind='mergesort')
+        self._compress(means[order], weights[order])
+
+    def _compress(self, means, weights):
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = np.floor(self.delta / np.pi * np.arcsin(2 * q - 1))
+        _, cluster = np.unique(k, return_inverse=True)
+        cluster_weights = np.bincount(cluster, weights=weights)
+        self.means = np.bincount(cluster, weights=means * weights) / cluster_weights
+        self.weights = cluster_weights
+
+    def quantile(self, q):
+        if self.means.size == 0:
+            return None
+        cumulative = np.cumsum(self.weights) - self.weights / 2
+        return float(np.interp(q * self.weights.sum(), cumulative, self.means))
+
+    def histogram(self, lo, hi, bins=HISTOGRAM_BINS):
+        if self.means.size == 0:
+            return None
+        counts, edges = np.histogram(self.means, bins=bins, range=(lo, hi), weights=self.weights)
+        return {'edges': edges.tolist(), 'counts': np.round(counts).astype(int).tolist()}
+
+
+class _ColumnProfile:
+
+    def __init__(self, role):
+        self.role = role
+        self.nulls = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.hll = HyperLogLog()
+        self.digest = TDigest() if role == 'numeric' else None
+        self.value_counts = {} if role in ('categorical', 'boolean') else None
+
+    def update(self, series):
+        self.count += len(series)
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        if values.empty:
+            return
+
+        self.hll.add(values.to_numpy())
+        if self.role in ('numeric', 'datetime'):
+            lo, hi = values.min(), values.max()
+            self.min = lo if self.min is None else min(self.min, lo)
+            self.max = hi if self.max is None else max(self.max, hi)
+        if self.digest is not None:
+            self.digest.add(values.to_numpy(dtype=np.float64))
+        if self.value_counts is not None:
+            chunk_counts = values.value_counts()
+            # Too many distinct values to be worth counting exactly
+            if len(chunk_counts) > EXACT_COUNTS_LIMIT:
+                self.value_counts = None
+                self.role = 'text'
+                return
+            for value, n in chunk_counts.items():
+                self.value_counts[value] = self.value_counts.get(value, 0) + int(n)
+            if len(self.value_counts) > EXACT_COUNTS_LIMIT:
+                self.value_counts = None
+                self.role = 'text'
+
+    def finish(self, dtype):
+        profile = {
+            'dtype': str(dtype),
+            'role': self.role,
+            'nulls': self.nulls,
+            'distinct': self.hll.count(),
+        }
+        if self.role == 'numeric' and self.min is not None:
+            profile['min'] = float(self.min)
+            profile['max'] = float(self.max)
+            profile['quantiles'] = {str(q): self.digest.quantile(q) for q in (0.05, 0.25, 0.5, 0.75, 0.95)}
+            profile['histogram'] = self.digest.histogram(float(self.min), float(self.max))
+        elif self.role == 'datetime' and self.min is not None:
+            profile['min'] = pd.Timestamp(self.min).isoformat()
+            profile['max'] = pd.Timestamp(self.max).isoformat()
+        if self.value_counts is not None and len(self.value_counts) > 20 and len(self.value_counts) == self.count - self.nulls:
+            # Every value unique (ids, names): counts carry no information
+            profile['role'] = 'identifier'
+        elif self.value_counts is not None:
+            profile['distinct'] = len(self.value_counts)
+            counts = sorted(self.value_counts.items(), key=lambda item: item[1], reverse=True)
+            profile['value_counts'] = {str(value): n for value, n in counts}
+        return profile
+
+
+def column_role(dtype):
+
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'boolean'
+    if pd.api.types.is_numeric_dtype(dtype):
+        return 'numeric'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'datetime'
+    return 'categorical'
+
+
+def build_profile(file_path):
+    """Profile a dataset in a single pass over the chunks of its columnar cache."""
+
+    columns = None
+    dtypes = None
+    rows = 0
+    for chunk in iter_dataset_chunks(file_path):
+        if columns is None:
+            dtypes = chunk.dtypes
+            columns = {col: _ColumnProfile(column_role(dtype)) for col, dtype in dtypes.items()}
+        rows += len(chunk)
+        for col, column in columns.items():
+            column.update(chunk[col])
+
+    columns = columns or {}
+    return {
+        'name': os.path.basename(file_path),
+        'rows': rows,
+        'columns': {col: column.finish(dtypes[col]) for col, column in columns.items()},
+    }
+
+
+def get_profile(file_path):
+
+    fingerprint = dataset_fingerprint(file_path)
+    with _profiles_lock:
+        profile = _profiles.get(fingerprint)
+    if profile is not None:
+        return profile
+
+    profile_file = os.path.join(PROFILE_DIR, f"{fingerprint}.json")
+    if os.path.exists(profile_file):
+        with open(profile_file, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+    else:
+        profile = build_profile(file_path)
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        tmp_file = f"{profile_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(profile, f)
+        os.replace(tmp_file, profile_file)
+
+    with _profiles_lock:
+        _profiles[fingerprint] = profile
+    return profile
+
+
+def describe_profile(profile, max_values=8):
+    """Compact, one-line-per-column description of a profile for LLM prompts."""
+
+    lines = [f"{profile['name']}: {profile['rows']} rows"]
+    for col, info in profile['columns'].items():
+        parts = [f"{col} ({info['role']}", f"{info['nulls']} nulls", f"~{info['distinct']} distinct"]
+        if info['role'] in ('numeric', 'datetime') and 'min' in info:
+            parts.append(f"range {info['min']}..{info['max']}")
+        if info['role'] == 'numeric' and info.get('quantiles'):
+            parts.append(f"median {info['quantiles']['0.5']:.4g}")
+        if 'value_counts' in info:
+            top = list(info['value_counts'].items())[:max_values]
+            parts.append('values ' + ', '.join(f"{value}={n}" for value, n in top))
+        lines.append('  - ' + ', '.join(parts) + ')')
+    return '\n'.join(lines)
+
+
+# Only "how many <rows> per <column>" is answered from the profile; anything with another
+# metric, a filter or a time bucket goes to the LLM
+_COUNT_QUESTION_RE = re.compile(
+    r"^(?:how many|count(?: the| of)?|number of)"
+    r"(?:\s+(?:the\s+)?(?P<subject>[a-z]+))?"
+    r"(?:\s+(?:are there|do we have|are|is|exist))?"
+    r"\s+(?:per|by|for each|for every|in each|across|grouped by)"
+    r"\s+(?:each\s+|the\s+)?(?P<group>[a-z0-9_/ -]+?)\s*\??$"
+)
+ROW_NOUNS = {'row', 'record', 'customer', 'client', 'user', 'entry', 'entrie', 'member', 'people',
+             'person', 'account', 'observation'}
+METRIC_WORDS = {'average', 'avg', 'mean', 'median', 'sum', 'total', 'rate', 'ratio', 'percent',
+                'percentage', 'share', 'min', 'max', 'minimum', 'maximum'}
+
+
+def _singular_tokens(text):
+
+    tokens = re.findall(r'[a-z0-9]+', text.lower())
+    # Crude singularisation so "tiers" matches a "loyalty_tier" column
+    return {t[:-1] if t.endswith('s') and len(t) > 3 else t for t in tokens}
+
+
+def answer_from_profile(question, profile):
+    """Answer exact "how many rows per <column>" questions from exact value counts.
+
+    Returns a two-column DataFrame of counts, or None when the question asks for
+    anything more (another metric, a filter, a time bucket) or the column is ambiguous.
+    """
+
+    question = ' '.join(question.lower().split())
+    match = _COUNT_QUESTION_RE.match(question)
+    if match is None or _singular_tokens(question) & METRIC_WORDS:
+        return None
+    subject = match.group('subject')
+    if subject is not None and not _singular_tokens(subject) & ROW_NOUNS:
+        return None
+
+    # Every word of the group phrase has to belong to one column, and only one column may fit
+    group_tokens = _singular_tokens(match.group('group'))
+    matches = [col for col in profile['columns'] if group_tokens <= _singular_tokens(col.replace('_', ' '))]
+    if len(matches) != 1 or 'value_counts' not in profile['columns'][matches[0]]:
+        return None
+    best = matches[0]
+
+    counts = profile['columns'][best]['value_counts']
+    return pd.DataFrame({best: list(counts.keys()), 'count': list(counts.values())})
@@ -0,0 +1,191 @@
+import math
+import os
+import re
+from utils.data_processor import load_dataset
+from utils.sql_engine import table_name
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+except ImportError:
+    _encoding = None
+
+# Token budget of each prompt section; whatever a section leaves unused rolls over to the next
+TEXT_BUDGETS = {'question': 200, 'schema': 500, 'passages': 800}
+CODE_BUDGETS = {'question': 200, 'schema': 600, 'sample_rows': 300}
+SQL_BUDGETS = CODE_BUDGETS
+
+SAMPLE_ROWS = 3
+MAX_LISTED_VALUES = 6
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text):
+    """Exact count with tiktoken when installed, otherwise a BPE-like estimate (~4 chars per token)."""
+
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_RE.findall(text))
+
+
+def truncate_to_tokens(text, budget):
+
+    if budget <= 0:
+        return ''
+    if count_tokens(text) <= budget:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:budget]) + '...'
+    # Shrink by the overshoot ratio until it fits; converges in a couple of steps
+    while text and count_tokens(text) > budget:
+        text = text[:int(len(text) * budget / count_tokens(text) * 0.95)]
+    return text + '...'
+
+
+def _question_words(question):
+
+    return set(re.findall(r'[a-z0-9]+', question.lower()))
+
+
+def _column_relevance(col, words):
+
+    return sum(part in words for part in re.split(r'[^a-z0-9]+', col.lower()) if len(part) > 2)
+
+
+def encode_schema(profile, question=''):
+    """One compact line per column, e.g. ``loyalty_tier:cat{Bronze,Silver,Gold} nulls=83``.
+
+    Columns the question mentions come first so that they survive truncation.
+    """
+
+    words = _question_words(question)
+    columns = sorted(
+        profile['columns'].items(),
+        key=lambda item: -_column_relevance(item[0], words),
+    )
+
+    lines = [f"{profile['name']} rows={profile['rows']}"]
+    for col, info in columns:
+        role = info['role']
+        if role == 'numeric' and 'min' in info:
+            desc = f"num[{info['min']:.4g}..{info['max']:.4g}]"
+            if info.get('quantiles'):
+                desc += f" med={info['quantiles']['0.5']:.4g}"
+        elif role == 'datetime' and 'min' in info:
+            desc = f"date[{info['min'][:10]}..{info['max'][:10]}]"
+        elif 'value_counts' in info and len(info['value_counts']) <= MAX_LISTED_VALUES:
+            desc = 'cat{' + ','.join(info['value_counts']) + '}'
+        elif role in ('categorical', 'boolean'):
+            desc = f"cat(~{info['distinct']})"
+        elif role == 'identifier':
+            desc = 'id'
+        else:
+            desc = f"text(~{info['distinct']})"
+        if info['nulls']:
+            desc += f" nulls={info['nulls']}"
+        lines.append(f" {col}:{desc}")
+    return '\n'.join(lines)
+
+
+def sample_rows(file_path, n=SAMPLE_ROWS):
+
+    return load_dataset(file_path).head(n).to_csv(index=False).strip()
+
+
+def _fit_lines(text, budget):
+
+    # Cut at line boundaries so a schema never ends mid-column
+    kept = []
+    used = 0
+    for line in text.split('\n'):
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    return '\n'.join(kept)
+
+
+def _assemble(sections, budgets):
+    """Fill ``(name, header, body)`` sections in order within their token budgets."""
+
+    parts = []
+    carry = 0
+    for name, header, body in sections:
+        budget = budgets.get(name, 0) + carry
+        if name == 'question':
+            fitted = truncate_to_tokens(body, budget)
+        else:
+            fitted = _fit_lines(body, budget)
+        carry = max(budget - count_tokens(fitted), 0)
+        if fitted:
+            parts.append(f"{header}\n{fitted}" if header else fitted)
+    return '\n\n'.join(parts)
+
+
+def build_text_prompt(question, profiles, passages, other_files=(), budgets=None):
+
+    budgets = {**TEXT_BUDGETS, **(budgets or {})}
+    schema = '\n'.join(encode_schema(profile, question) for profile in profiles.values())
+    if other_files:
+        schema += '\nOther files: ' + ', '.join(other_files)
+
+    # Whole passages in rank order; lower-ranked ones drop out first
+    passage_lines = []
+    remaining = budgets['passages']
+    for passage in passages:
+        line = f"[{passage['source']}] {passage['text']}"
+        cost = count_tokens(line)
+        if cost > remaining:
+            line = truncate_to_tokens(line, remaining)
+            cost = remaining
+        if not line:
+            break
+        passage_lines.append(line)
+        remaining -= cost
+
+    return _assemble([
+        ('question', 'User question:', question),
+        ('schema', 'Available data:', schema),
+        ('passages', 'Relevant document passages:', '\n'.join(passage_lines)),
+    ], budgets)
+
+
+def build_code_prompt(question, profiles, csv_files, budgets=None):
+
+    budgets = {**CODE_BUDGETS, **(budgets or {})}
+    schema = '\n'.join(encode_schema(profiles[os.path.basename(f)], question) for f in csv_files)
+    samples = '\n'.join(f"{os.path.basename(f)}:\n{sample_rows(f)}" for f in csv_files)
+
+    instructions = (
+        f"Write Python pandas code that answers the question using: {', '.join(os.path.basename(f) for f in csv_files)}.\n"
+        "Load the CSV data, process and aggregate as needed, and assign the final DataFrame to result_df.\n"
+        "Return only code, without explanations."
+    )
+    return _assemble([
+        ('question', 'User question:', question),
+        ('instructions', None, instructions),
+        ('schema', 'Columns (name:type):', schema),
+        ('sample_rows', 'Sample rows:', samples),
+    ], {**budgets, 'instructions': count_tokens(instructions) + 10})
+
+
+def build_sql_prompt(question, profiles, csv_files, budgets=None):
+
+    budgets = {**SQL_BUDGETS, **(budgets or {})}
+    schema = '\n'.join(encode_schema(profiles[os.path.basename(f)], question) for f in csv_files)
+    samples = '\n'.join(f"{table_name(f)}:\n{sample_rows(f)}" for f in csv_files)
+
+    tables = ', '.join(f"{table_name(f)} (from {os.path.basename(f)})" for f in csv_files)
+    instructions = (
+        f"Write one DuckDB SQL SELECT query that answers the question using the tables: {tables}.\n"
+        "Aggregate in SQL (GROUP BY, COUNT, date_trunc for time buckets) and return only the rows needed for a chart.\n"
+        "Return only SQL, without explanations."
+    )
+    return _assemble([
+        ('question', 'User question:', question),
+        ('instructions', None, instructions),
+        ('schema', 'Columns (name:type):', schema),
+        ('sample_rows', 'Sample rows:', samples),
+    ], {**budgets, 'instructions': count_tokens(instructions) + 10})
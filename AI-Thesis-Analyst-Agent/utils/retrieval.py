@@ -0,0 +1,285 @@
+import numpy as np
+import scipy.sparse as sp
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from utils.data_processor import dataset_fingerprint
+from utils.pdf_extractor import document_hash, get_pdf_pages
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cache', 'index')
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+CHUNK_WORDS = 120
+CHUNK_OVERLAP = 20
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'do', 'for', 'from', 'how', 'in', 'is', 'it',
+    'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'we', 'what', 'which', 'with', 'you',
+}
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Per-document term counts kept in memory and on disk, and merged indexes (cheap to rebuild) in memory
+MAX_MEMORY_DOCUMENTS = 64
+MAX_DISK_DOCUMENTS = 256
+MAX_MERGED_INDEXES = 8
+
+_documents = OrderedDict()
+_indexes = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def tokenize(text):
+
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+
+    words = text.split()
+    if not words:
+        return []
+    step = max(chunk_words - overlap, 1)
+    return [' '.join(words[i:i + chunk_words]) for i in range(0, max(len(words) - overlap, 1), step)]
+
+
+class DocumentTerms:
+    """Chunks of one document and their raw term counts, the unit that is built and stored.
+
+    Corpus statistics (idf, average chunk length) depend on which documents are searched
+    together, so they are applied when documents are merged into a RetrievalIndex.
+    """
+
+    def __init__(self, chunks, sources, vocabulary, counts):
+        self.chunks = chunks
+        self.sources = sources
+        self.vocabulary = vocabulary
+        self.counts = counts.tocsr()
+
+    @classmethod
+    def build(cls, source, text):
+
+        chunks = chunk_text(text)
+        term_ids = {}
+        rows, cols, counts = [], [], []
+        for row, chunk in enumerate(chunks):
+            tf = {}
+            for token in tokenize(chunk):
+                tf[token] = tf.get(token, 0) + 1
+            for token, count in tf.items():
+                rows.append(row)
+                cols.append(term_ids.setdefault(token, len(term_ids)))
+                counts.append(count)
+
+        vocabulary = [None] * len(term_ids)
+        for term, i in term_ids.items():
+            vocabulary[i] = term
+
+        tf_matrix = sp.csr_matrix(
+            (np.asarray(counts, dtype=np.float64), (rows, cols)),
+            shape=(len(chunks), len(vocabulary)),
+        )
+        return cls(chunks, [source] * len(chunks), vocabulary, tf_matrix)
+
+    def save(self, path_prefix):
+
+        os.makedirs(os.path.dirname(path_prefix), exist_ok=True)
+        # Write both files under temp names and rename them into place, so a concurrent
+        # reader sees either the whole pair or nothing
+        tmp_prefix = f"{path_prefix}.{os.getpid()}.{threading.get_ident()}.tmp"
+        sp.save_npz(f"{tmp_prefix}.npz", self.counts)
+        with open(f"{tmp_prefix}.json", 'w', encoding='utf-8') as f:
+            json.dump({'chunks': self.chunks, 'sources': self.sources, 'vocabulary': self.vocabulary}, f)
+        os.replace(f"{tmp_prefix}.npz", f"{path_prefix}.npz")
+        # The json file is written last and marks the pair as complete
+        os.replace(f"{tmp_prefix}.json", f"{path_prefix}.json")
+
+    @classmethod
+    def load(cls, path_prefix):
+
+        with open(f"{path_prefix}.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        counts = sp.load_npz(f"{path_prefix}.npz")
+        return cls(meta['chunks'], meta['sources'], meta['vocabulary'], counts)
+
+
+class RetrievalIndex:
+    """BM25 index over document chunks, stored as a term-major sparse weight matrix."""
+
+    def __init__(self, chunks, sources, vocabulary, weights):
+        self.chunks = chunks
+        self.sources = sources
+        self.vocabulary = vocabulary
+        self.term_ids = {term: i for i, term in enumerate(vocabulary)}
+        # CSC so that selecting the query's term columns is a cheap slice
+        self.weights = weights.tocsc()
+
+    @classmethod
+    def build(cls, documents):
+
+        return cls.merge([DocumentTerms.build(source, text) for source, text in documents])
+
+    @classmethod
+    def merge(cls, parts):
+        """Combine per-document term counts into one index; only re-maps term ids, no re-tokenizing."""
+
+        chunks, sources = [], []
+        term_ids = {}
+        rows, cols, counts = [], [], []
+        for part in parts:
+            columns = np.fromiter(
+                (term_ids.setdefault(term, len(term_ids)) for term in part.vocabulary),
+                dtype=np.int64, count=len(part.vocabulary),
+            )
+            coo = part.counts.tocoo()
+            rows.append(coo.row + len(chunks))
+            cols.append(columns[coo.col])
+            counts.append(coo.data)
+            chunks.extend(part.chunks)
+            sources.extend(part.sources)
+
+        vocabulary = [None] * len(term_ids)
+        for term, i in term_ids.items():
+            vocabulary[i] = term
+
+        shape = (len(chunks), len(vocabulary))
+        if rows:
+            tf_matrix = sp.csr_matrix((np.concatenate(counts), (np.concatenate(rows), np.concatenate(cols))), shape=shape)
+        else:
+            tf_matrix = sp.csr_matrix(shape, dtype=np.float64)
+        doc_lengths = np.asarray(tf_matrix.sum(axis=1)).ravel()
+
+        # Fold idf and length normalisation into the stored weights so that scoring
+        # a query is only a column slice and a row sum
+        n_docs = max(len(chunks), 1)
+        df = np.bincount(tf_matrix.indices, minlength=len(vocabulary))
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        avg_length = doc_lengths.mean() if len(chunks) else 1.0
+        norm = K1 * (1 - B + B * doc_lengths / max(avg_length, 1e-9))
+
+        weights = tf_matrix.tocoo()
+        data = weights.data * (K1 + 1) / (weights.data + norm[weights.row]) * idf[weights.col]
+        weights = sp.csr_matrix((data, (weights.row, weights.col)), shape=tf_matrix.shape)
+        return cls(chunks, sources, vocabulary, weights)
+
+    def search(self, query, k=5):
+
+        ids = sorted({self.term_ids[t] for t in tokenize(query) if t in self.term_ids})
+        if not ids or not self.chunks:
+            return []
+
+        scores = np.asarray(self.weights[:, ids].sum(axis=1)).ravel()
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {'source': self.sources[i], 'text': self.chunks[i], 'score': float(scores[i])}
+            for i in top if scores[i] > 0
+        ]
+
+
+def _document_key(file_path):
+
+    if file_path.endswith('.pdf'):
+        return document_hash(file_path)
+    return dataset_fingerprint(file_path)
+
+
+def _read_document(file_path):
+
+    if file_path.endswith('.pdf'):
+        return '\n'.join(get_pdf_pages(file_path))
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _remember(cache, key, value, limit):
+
+    with _index_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+
+def _prune_disk():
+
+    # Oldest documents go first; a pair is complete once its json file exists
+    try:
+        names = [n for n in os.listdir(INDEX_DIR) if n.endswith('.json') and '.tmp' not in n]
+    except FileNotFoundError:
+        return
+    if len(names) <= MAX_DISK_DOCUMENTS:
+        return
+    paths = sorted((os.path.join(INDEX_DIR, n) for n in names), key=lambda p: os.path.getmtime(p))
+    for path in paths[:len(paths) - MAX_DISK_DOCUMENTS]:
+        for suffix in ('.json', '.npz'):
+            try:
+                os.remove(path[:-len('.json')] + suffix)
+            except OSError:
+                pass
+
+
+def index_document(file_path):
+    """Term counts for one document, built once per version of its content and kept on disk."""
+
+    key = _document_key(file_path)
+    with _index_lock:
+        terms = _documents.get(key)
+        if terms is not None:
+            _documents.move_to_end(key)
+            return terms
+
+    path_prefix = os.path.join(INDEX_DIR, key)
+    if os.path.exists(f"{path_prefix}.json") and os.path.exists(f"{path_prefix}.npz"):
+        terms = DocumentTerms.load(path_prefix)
+    else:
+        terms = DocumentTerms.build(os.path.basename(file_path), _read_document(file_path))
+        terms.save(path_prefix)
+        _prune_disk()
+
+    _remember(_documents, key, terms, MAX_MEMORY_DOCUMENTS)
+    return terms
+
+
+def get_index(file_paths):
+
+    file_paths = sorted(file_paths)
+    keys = [_document_key(p) for p in file_paths]
+    index_key = hashlib.sha1('|'.join(sorted(keys)).encode('utf-8')).hexdigest()
+
+    with _index_lock:
+        index = _indexes.get(index_key)
+        if index is not None:
+            _indexes.move_to_end(index_key)
+    if index is not None:
+        return index
+
+    # A new upload only indexes itself; the rest of the folder is merged from stored counts
+    index = RetrievalIndex.merge([index_document(p) for p in file_paths])
+    _remember(_indexes, index_key, index, MAX_MERGED_INDEXES)
+    return index
+
+
+def retrieve_passages(question, file_paths, k=5, budget_chars=2000):
+
+    if not file_paths:
+        return []
+
+    passages = []
+    used = 0
+    for hit in get_index(file_paths).search(question, k=k):
+        remaining = budget_chars - used
+        if remaining <= 0:
+            break
+        if len(hit['text']) > remaining:
+            hit['text'] = hit['text'][:remaining]
+        passages.append(hit)
+        used += len(hit['text'])
+    return passages
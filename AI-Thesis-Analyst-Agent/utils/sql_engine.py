@@ -0,0 +1,106 @@
+import os
+import re
+import threading
+import pyarrow as pa
+from utils.data_processor import CACHE_DIR, open_dataset_table
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Memory DuckDB may use before spilling to SQL_TEMP_DIR, shared by all queries
+SQL_MEMORY_LIMIT = os.environ.get('AI_ANALYST_SQL_MEMORY', '2GB')
+# Worker threads for all queries together, so generated SQL can't take every core from the web process
+SQL_THREADS = int(os.environ.get('AI_ANALYST_SQL_THREADS', 0)) or max(1, min(4, (os.cpu_count() or 2) // 2))
+# Seconds a single query may run before it is interrupted
+SQL_TIMEOUT = float(os.environ.get('AI_ANALYST_SQL_TIMEOUT', 30))
+SQL_TEMP_DIR = os.path.join(CACHE_DIR, 'duckdb')
+
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+
+_db = None
+_db_lock = threading.Lock()
+
+
+class SQLError(Exception):
+    pass
+
+
+def sql_available():
+
+    return duckdb is not None
+
+
+def table_name(file_path):
+    """SQL identifier a dataset is exposed under, e.g. ``customer_base_dataset``."""
+
+    name = re.sub(r'\W+', '_', os.path.splitext(os.path.basename(file_path))[0]).strip('_').lower()
+    return name if name and not name[0].isdigit() else f"t_{name}"
+
+
+def _database():
+
+    global _db
+    with _db_lock:
+        if _db is None:
+            os.makedirs(SQL_TEMP_DIR, exist_ok=True)
+            # Queries can only see the registered datasets: no reading or writing files
+            _db = duckdb.connect(config={
+                'enable_external_access': False,
+                'memory_limit': SQL_MEMORY_LIMIT,
+                'threads': SQL_THREADS,
+                'temp_directory': SQL_TEMP_DIR,
+            })
+        return _db
+
+
+def _single_select(sql):
+
+    sql = _FENCE_RE.sub('', sql.strip()).strip().rstrip(';')
+    statements = duckdb.extract_statements(sql)
+    if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+        raise SQLError("Expected a single SELECT query")
+    return sql
+
+
+def run_sql(sql, csv_files, timeout=SQL_TIMEOUT):
+    """Run a read-only query over the cached datasets and return a DataFrame.
+
+    Every dataset is registered under ``table_name(path)`` straight from its memory-mapped
+    Arrow cache file, so nothing is copied before DuckDB scans it (on SQL_THREADS threads,
+    spilling to disk past SQL_MEMORY_LIMIT). A query still running after ``timeout``
+    seconds is interrupted and raises SQLError.
+    """
+
+    if duckdb is None:
+        raise SQLError("DuckDB is not installed")
+
+    # A cursor is a separate connection, so registrations never leak between requests
+    cursor = _database().cursor()
+    timed_out = threading.Event()
+
+    def interrupt():
+        timed_out.set()
+        cursor.interrupt()
+
+    timer = threading.Timer(timeout, interrupt)
+    timer.daemon = True
+    try:
+        query = _single_select(sql)
+        for path in csv_files:
+            try:
+                table = open_dataset_table(path)
+            except (OSError, ValueError, pa.ArrowException) as e:
+                # A missing or unreadable dataset cache fails the query, so the caller can fall back
+                raise SQLError(f"Could not open {os.path.basename(path)}: {e}") from e
+            cursor.register(table_name(path), table)
+        timer.start()
+        return cursor.execute(query).df()
+    except duckdb.Error as e:
+        if timed_out.is_set():
+            raise SQLError(f"Query interrupted after {timeout:g}s") from e
+        raise SQLError(str(e)) from e
+    finally:
+        timer.cancel()
+        cursor.close()
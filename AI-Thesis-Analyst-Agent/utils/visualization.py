@@ -1,14 +1,43 @@
+import functools
+import json
+import threading
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
+import numpy as np
 import pandas as pd
+from utils.profiler import column_role
 
-def generate_plotly_chart(df, question):
+# Point budget per trace sent to the browser: longer lines are downsampled, dense
+# scatters move to WebGL and, past DENSITY_POINTS, become a binned heatmap
+MAX_LINE_POINTS = 2000
+WEBGL_POINTS = 2000
+DENSITY_POINTS = 20000
+DENSITY_BINS = 200
+
+# Layout template of every chart; specs leave it out and the page applies it (see chart_template)
+CHART_TEMPLATE = 'plotly_white'
+
+# Upper bound on histogram bins; integer columns with a narrower range get one bar per value
+HISTOGRAM_MAX_BINS = 100
+
+# px already renders long scatters with WebGL, so both trace types are budgeted
+_SCATTER_TYPES = ('scatter', 'scattergl')
+
+# Per-point trace arrays that have to be cut down along with x and y
+_POINT_ARRAYS = ('customdata', 'text', 'hovertext', 'ids')
+
+# plotly.express reads the shared template objects while building a figure, which races
+# between threads ("ValueError: Invalid value"), so figures are built one at a time
+_figure_lock = threading.Lock()
+
+def generate_plotly_chart(df, question, column_info=None):
    
     try:
         
         if hasattr(df, 'to_html'):
             
-            chart_html = create_chart_based_on_data(df, question)
+            chart_html = create_chart_based_on_data(df, question, column_info)
         else:
             
             chart_html = f"<pre>{str(df)}</pre>"
@@ -19,35 +48,96 @@ def generate_plotly_chart(df, question):
         print(f"Error generating chart: {str(e)}")
         return f"<div class='error'>Error generating visualization: {str(e)}</div>"
 
-def create_chart_based_on_data(df, question):
+def generate_chart_spec(df, question, column_info=None):
+    """Plotly figure as a JSON-ready dict (``data``/``layout``), or None if there is nothing to draw.
+
+    Numeric arrays are carried as base64 typed arrays (``{'dtype', 'bdata'}``), which the
+    page's plotly.js decodes directly; the page loads plotly.js once for every chart.
+    """
+    
+    try:
+        
+        with _figure_lock:
+            if hasattr(df, 'to_html'):
+                
+                fig = build_figure(df, question, column_info)
+            else:
+                
+                fig = go.Figure(go.Table(header={'values': ['Result']}, cells={'values': [[str(df)]]}))
+                
+            if fig is None:
+                return None
+            spec = json.loads(pio.to_json(fig, validate=False))
+        # The template is most of a small figure's JSON and the same for every chart
+        spec.get('layout', {}).pop('template', None)
+        return spec
+    
+    except Exception as e:
+        print(f"Error generating chart: {str(e)}")
+        return None
+
+@functools.lru_cache(maxsize=None)
+def _template_json():
+    
+    with _figure_lock:
+        return pio.to_json(go.Figure(layout={'template': CHART_TEMPLATE}), validate=False)
+
+def chart_template():
+    """The CHART_TEMPLATE layout template, for the page to apply to every chart spec."""
+    
+    return json.loads(_template_json())['layout']['template']
+
+def column_roles(df, column_info=None):
+    
+    # One dtype pass per chart; dataset profiles refine columns the dtype alone can't classify
+    column_info = column_info or {}
+    roles = {}
+    for col, dtype in df.dtypes.items():
+        role = column_role(dtype)
+        profiled = column_info.get(col, {}).get('role')
+        if role == 'categorical' and profiled in ('datetime', 'identifier', 'text'):
+            role = profiled
+        roles[col] = role
+    return roles
+
+def create_chart_based_on_data(df, question, column_info=None):
     
+    with _figure_lock:
+        fig = build_figure(df, question, column_info)
+        if fig is None:
+            return "<div>No data available for visualization</div>"
+        
+        return fig.to_html(full_html=False, include_plotlyjs='cdn')
+
+def build_figure(df, question, column_info=None):
+    """Pick a chart for ``df`` from the question and column roles; None for an empty frame."""
+    
+    title = format_question_as_title(question)
     question = question.lower()
     num_columns = len(df.columns)
     
     
     if df.empty:
-        return "<div>No data available for visualization</div>"
+        return None
     
+    roles = column_roles(df, column_info)
+    numeric_cols = [col for col, role in roles.items() if role == 'numeric']
+    date_cols = [col for col, role in roles.items() if role == 'datetime']
+    categorical_cols = [col for col, role in roles.items() if role in ('categorical', 'boolean')]
+    fig = None
     
     if 'distribution' in question or 'histogram' in question:
         
-        numeric_cols = df.select_dtypes(include=['number']).columns
         if len(numeric_cols) > 0:
-            fig = px.histogram(df, x=numeric_cols[0])
+            fig = histogram_figure(df[numeric_cols[0]])
     
     elif 'correlation' in question or 'relationship' in question or 'scatter' in question:
         
-        numeric_cols = df.select_dtypes(include=['number']).columns
         if len(numeric_cols) >= 2:
             fig = px.scatter(df, x=numeric_cols[0], y=numeric_cols[1])
     
     elif 'trend' in question or 'time' in question or 'over time' in question:
         
-        date_cols = [col for col in df.columns if df[col].dtype == 'datetime64[ns]' 
-                     or 'date' in col.lower() or 'time' in col.lower()]
-        
-        numeric_cols = df.select_dtypes(include=['number']).columns
-        
         if date_cols and len(numeric_cols) > 0:
             fig = px.line(df, x=date_cols[0], y=numeric_cols[0])
         elif len(numeric_cols) >= 2:
@@ -56,16 +146,13 @@ def create_chart_based_on_data(df, question):
     
     elif 'comparison' in question or 'compare' in question or 'bar' in question:
         
-        categorical_cols = df.select_dtypes(include=['object', 'category']).columns
-        numeric_cols = df.select_dtypes(include=['number']).columns
-        
-        if categorical_cols.any() and numeric_cols.any():
-            fig = px.bar(df, x=categorical_cols[0], y=numeric_cols[0])
+        if categorical_cols and numeric_cols:
+            fig = bar_figure(df, categorical_cols[0], numeric_cols[0])
         elif len(numeric_cols) >= 2:
             
-            fig = px.bar(df, x=numeric_cols[0], y=numeric_cols[1])
+            fig = bar_figure(df, numeric_cols[0], numeric_cols[1])
     
-    else:
+    if fig is None:
         
         if num_columns >= 2:
             
@@ -73,27 +160,211 @@ def create_chart_based_on_data(df, question):
                 fig = px.line(df)
             else:
                 
-                cat_cols = df.select_dtypes(include=['object', 'category']).columns
-                x_col = cat_cols[0] if len(cat_cols) > 0 else df.columns[0]
+                x_col = categorical_cols[0] if len(categorical_cols) > 0 else df.columns[0]
                 
                 
-                num_cols = df.select_dtypes(include=['number']).columns
-                y_col = num_cols[0] if len(num_cols) > 0 else df.columns[1]
+                y_col = numeric_cols[0] if len(numeric_cols) > 0 else df.columns[1]
                 
-                fig = px.bar(df, x=x_col, y=y_col)
+                fig = bar_figure(df, x_col, y_col)
         else:
             
-            fig = px.histogram(df, x=df.columns[0])
+            fig = histogram_figure(df[df.columns[0]])
+    
     
+    apply_point_budget(fig)
     
     fig.update_layout(
-        title=format_question_as_title(question),
+        title=title,
         xaxis_title=fig.layout.xaxis.title.text or "X-Axis",
         yaxis_title=fig.layout.yaxis.title.text or "Y-Axis",
-        template="plotly_white"
+        template=CHART_TEMPLATE
     )
     
-    return fig.to_html(full_html=False, include_plotlyjs='cdn')
+    return fig
+
+def histogram_figure(series):
+    """Histogram with the counts computed here, so only one value per bin reaches the browser."""
+    
+    name = str(series.name)
+    if column_role(series.dtype) != 'numeric':
+        # Categories (and booleans) are counted from their codes
+        codes, uniques = pd.factorize(series, sort=True)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        return px.bar(x=np.asarray(uniques).astype(str), y=counts, labels={'x': name, 'y': 'count'})
+    
+    values = series.to_numpy(dtype=float, na_value=np.nan)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return px.bar(x=[], y=[], labels={'x': name, 'y': 'count'})
+    
+    low, high = values.min(), values.max()
+    if pd.api.types.is_integer_dtype(series.dtype) and high - low < HISTOGRAM_MAX_BINS:
+        counts = np.bincount((values - low).astype(np.int64))
+        centers = low + np.arange(len(counts))
+        widths = np.ones(len(counts))
+    else:
+        counts, edges = np.histogram(values, bins='auto')
+        if len(counts) > HISTOGRAM_MAX_BINS:
+            counts, edges = np.histogram(values, bins=HISTOGRAM_MAX_BINS)
+        centers = (edges[:-1] + edges[1:]) / 2
+        widths = np.diff(edges)
+    
+    fig = px.bar(x=centers, y=counts, labels={'x': name, 'y': 'count'})
+    fig.update_traces(width=widths)
+    fig.update_layout(bargap=0)
+    return fig
+
+def bar_figure(df, x_col, y_col):
+    """Bar chart of ``y_col`` summed per ``x_col`` value (what stacking raw rows would show)."""
+    
+    if column_role(df[y_col].dtype) != 'numeric' or not df[x_col].duplicated().any():
+        return px.bar(df, x=x_col, y=y_col)
+    
+    # First-appearance order, so results the code already sorted keep their order
+    codes, uniques = pd.factorize(df[x_col], sort=False)
+    values = df[y_col].to_numpy(dtype=float, na_value=np.nan)
+    keep = (codes >= 0) & ~np.isnan(values)
+    totals = np.bincount(codes[keep], weights=values[keep], minlength=len(uniques))
+    return px.bar(x=np.asarray(uniques), y=totals, labels={'x': str(x_col), 'y': str(y_col)})
+
+def _as_numbers(values):
+    
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[ns]').astype('int64').astype(float)
+    if np.issubdtype(values.dtype, np.number) or values.dtype == bool:
+        return values.astype(float)
+    return None
+
+def lttb_indices(x, y, n_out):
+    """Indices kept by Largest-Triangle-Three-Buckets; ``x`` must be sorted."""
+    
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    
+    # First and last points are always kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i + 2 < len(edges):
+            avg_x = np.nanmean(x[edges[i + 1]:edges[i + 2]])
+            avg_y = np.nanmean(y[edges[i + 1]:edges[i + 2]])
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        # Keep the point forming the largest triangle with the previous pick and the next bucket's mean
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        selected[i + 1] = a
+    return selected
+
+def minmax_indices(y, n_out):
+    """Indices of the minimum and maximum of each of ``n_out // 2`` equal buckets, in order."""
+    
+    n = len(y)
+    buckets = max(1, n_out // 2)
+    if n <= n_out:
+        return np.arange(n)
+    
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    lows = offsets + np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    highs = offsets + np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    indices = np.concatenate([lows, highs])
+    return np.unique(indices[indices < n])
+
+def _take_points(trace, indices):
+    
+    n = len(trace.x)
+    updates = {'x': np.asarray(trace.x)[indices], 'y': np.asarray(trace.y)[indices]}
+    for name in _POINT_ARRAYS:
+        values = trace[name]
+        if values is not None and not isinstance(values, str) and len(values) == n:
+            updates[name] = np.asarray(values)[indices]
+    trace.update(updates)
+
+def _density_heatmap(trace, x, y):
+    
+    keep = ~(np.isnan(x) | np.isnan(y))
+    counts, x_edges, y_edges = np.histogram2d(x[keep], y[keep], bins=DENSITY_BINS)
+    # Empty cells stay transparent instead of drawing the lowest colour
+    z = np.where(counts.T > 0, counts.T, np.nan)
+    return go.Heatmap(
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        z=z,
+        colorscale='Blues',
+        colorbar={'title': {'text': 'count'}},
+        name=trace.name,
+        hovertemplate='x=%{x}<br>y=%{y}<br>count=%{z}<extra></extra>',
+    )
+
+def apply_point_budget(fig):
+    """Keep every trace within the point budget; returns whether anything was reduced.
+
+    A reduced figure says so in ``layout.meta`` and in a small annotation.
+    """
+    
+    original = shown = 0
+    reduced = False
+    traces = []
+    markers = [t for t in fig.data if t.type in _SCATTER_TYPES and 'lines' not in (t.mode or 'lines')]
+    
+    for trace in fig.data:
+        if trace.type not in _SCATTER_TYPES or trace.x is None or trace.y is None:
+            traces.append(trace)
+            continue
+        n = len(trace.x)
+        original += n
+        x, y = _as_numbers(trace.x), _as_numbers(trace.y)
+        
+        if 'lines' in (trace.mode or 'lines'):
+            if n > MAX_LINE_POINTS and y is not None:
+                # LTTB needs a sorted x; otherwise bucket by position, which is drawing order
+                if x is not None and np.all(np.diff(x) >= 0):
+                    indices = lttb_indices(x, y, MAX_LINE_POINTS)
+                else:
+                    indices = minmax_indices(y, MAX_LINE_POINTS)
+                _take_points(trace, indices)
+                reduced = True
+            traces.append(trace)
+            shown += len(trace.x)
+            continue
+        
+        if n > DENSITY_POINTS and len(markers) == 1 and x is not None and y is not None:
+            traces.append(_density_heatmap(trace, x, y))
+            shown += DENSITY_BINS * DENSITY_BINS
+            reduced = True
+            continue
+        if n > DENSITY_POINTS:
+            # Several groups or non-numeric axes: an even subsample keeps each group's shape
+            _take_points(trace, np.linspace(0, n - 1, DENSITY_POINTS).astype(int))
+            reduced = True
+        if trace.type == 'scatter' and len(trace.x) > WEBGL_POINTS:
+            trace = go.Scattergl(trace.to_plotly_json(), skip_invalid=True)
+        traces.append(trace)
+        shown += len(trace.x)
+    
+    if reduced:
+        fig.data = []
+        fig.add_traces(traces)
+        fig.update_layout(meta={'reduced': True, 'points': original, 'shown_points': shown})
+        fig.add_annotation(
+            text=f"Reduced from {original:,} points for display",
+            xref='paper', yref='paper', x=1, y=1.02, xanchor='right', yanchor='bottom',
+            showarrow=False, font={'size': 10, 'color': 'gray'},
+        )
+    elif any(t is not o for t, o in zip(traces, fig.data)):
+        fig.data = []
+        fig.add_traces(traces)
+    return reduced
 
 def format_question_as_title(question):
     